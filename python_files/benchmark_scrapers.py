@@ -0,0 +1,75 @@
+"""
+    Offline throughput benchmark of the scraping functions, run against FakeTwitterAPI instances.
+
+    For each scraping function, crawl size (number of profiles) and number of credentials it reports
+    the API calls made per endpoint, the simulated wall-clock time and the part of it spent waiting on rate limits,
+    the real time taken by the python code and its peak memory.
+
+    usage: python benchmark_scrapers.py --sizes 10 100 --credentials 1 4
+"""
+import time
+import argparse
+import tracemalloc
+from collections import Counter
+import numpy as np
+import pandas as pd
+from crawl_metrics_utils import CrawlMetrics
+from fake_twitter_api import FakeTwitterGraph, VirtualClock, fake_credentials
+from graph_scraping_utils import fetch_contacts, fetch_contacts_named, fetch_network, twitter_monitor
+
+SCENARIOS = {
+    'fetch_contacts': lambda api, ids, metrics: fetch_contacts(api, ids, 'all', metrics=metrics),
+    'fetch_contacts_named': lambda api, ids, metrics: fetch_contacts_named(api, [f'user{i}' for i in ids], 'all',
+                                                                           metrics=metrics),
+    'fetch_network': lambda api, ids, metrics: fetch_network(api, ids[0], max_users=len(ids), metrics=metrics),
+    'twitter_monitor': lambda api, ids, metrics: twitter_monitor(api, [f'user{i}' for i in ids], metrics=metrics),
+}
+
+
+def run_benchmark(scenario, size, graph, n_credentials=1, latency=0.2, seed=0):
+    """
+    runs one scraping function over `size` profiles of graph and returns its measurements as a dictionary;
+    the credentials are pooled by the scraping function on their virtual clock, which reports every rate-limit wait
+    """
+    clock = VirtualClock()
+    metrics = CrawlMetrics(sinks=[], clock=clock.now)
+    apis = fake_credentials(n_credentials, graph, clock, wait_on_rate_limit=False, latency=latency)
+    ids = np.random.default_rng(seed).choice(graph.n_users, size=size, replace=False).tolist()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = SCENARIOS[scenario](apis, ids, metrics)
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    calls = sum((a.calls for a in apis), Counter())
+    summary = metrics.summary()
+    row = {'function': scenario, 'size': size, 'credentials': n_credentials, 'rows': len(result),
+           'api_calls': sum(calls.values()), 'errors': sum(summary['errors'].values()),
+           'simulated_hours': clock.now() / 3600, 'rate_limited_hours': summary['rate_limited_seconds'] / 3600,
+           'wall_seconds': wall, 'peak_memory_mb': peak / 2 ** 20}
+    row.update({f'calls_{endpoint}': count for endpoint, count in sorted(calls.items())})
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--functions', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100])
+    parser.add_argument('--credentials', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--users', type=int, default=20_000, help='accounts in the synthetic graph')
+    parser.add_argument('--mean-friends', type=float, default=100)
+    parser.add_argument('--latency', type=float, default=0.2, help='simulated seconds per API call')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph = FakeTwitterGraph(args.users, args.mean_friends, seed=args.seed)
+    rows = [run_benchmark(function, size, graph, n, args.latency, args.seed)
+            for function in args.functions for size in args.sizes for n in args.credentials]
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(pd.DataFrame(rows).fillna(0).round(3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
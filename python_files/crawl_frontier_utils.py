@@ -0,0 +1,82 @@
+import os
+import pickle
+from heapq import heappush, heappop
+from collections import Counter
+
+
+class CrawlFrontier:
+    """
+        Deduplicated priority frontier of a network crawl.
+
+        Every user is expanded at most once (the `visited` set) and is queued with the smallest hop
+        at which it was discovered. Users are popped in order of:
+        - priority = 'proximity': hop from the seed, i.e. a plain breadth-first crawl;
+        - priority = 'degree': number of crawled accounts linking to them, most connected first,
+          so that a crawl capped by max_users keeps the core of the network.
+
+    :param str priority: either 'proximity' or 'degree'.
+    """
+    def __init__(self, priority='proximity'):
+        if priority not in ('proximity', 'degree'):
+            raise ValueError("Unknown priority: priority should be one of 'proximity', 'degree'")
+        self.priority = priority
+        self.hops = {}            # user -> smallest hop at which it was discovered
+        self.degree = Counter()   # user -> times it was discovered
+        self.visited = set()      # users already expanded
+        self._heap = []
+        self._seq = 0             # insertion order, breaks ties between equal priorities
+        self._front = 0           # requeued users get negative insertion orders
+
+    def _key(self, user):
+        if self.priority == 'proximity':
+            return (self.hops[user],)
+        return (-self.degree[user], self.hops[user])
+
+    def push(self, user, hop):
+        """ queues a user discovered at the given hop, unless it was already expanded """
+        self.degree[user] += 1
+        if user in self.visited:
+            return
+        if user in self.hops and hop >= self.hops[user] and self.priority == 'proximity':
+            return  # already queued with the same key
+        self.hops[user] = min(hop, self.hops.get(user, hop))
+        heappush(self._heap, (self._key(user), self._seq, user))
+        self._seq += 1
+
+    def pop(self):
+        """ returns the (user, hop) with the highest priority and marks it visited, None if empty """
+        while self._heap:
+            key, _, user = heappop(self._heap)
+            if user in self.visited or key != self._key(user):
+                continue  # already expanded, or a stale entry superseded by a later push
+            self.visited.add(user)
+            return user, self.hops[user]
+        return None
+
+    def requeue(self, users):
+        """
+        puts back popped users that could not be expanded (e.g. because the crawl ran out of calls),
+        in their order and ahead of the users queued with the same priority
+        """
+        self._front -= len(users)
+        for i, user in enumerate(users):
+            self.visited.discard(user)
+            heappush(self._heap, (self._key(user), self._front + i, user))
+
+    def save(self, path, **extra):
+        """ atomically pickles the frontier (plus any extra crawl state) to path """
+        state = dict(self.__dict__, extra=extra)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """ restores a frontier saved with `save`, returns it together with the extra crawl state """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        extra = state.pop('extra')
+        frontier = cls.__new__(cls)
+        frontier.__dict__.update(state)
+        return frontier, extra
@@ -0,0 +1,180 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from collections import Counter, defaultdict
+import tweepy
+from credential_pool_utils import EndpointProxy
+from fetch_budget_utils import BudgetExhausted
+
+# upper bounds in seconds of the latency histogram buckets, the last one catches everything slower
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+# log level of each kind of event in a LoggingSink
+EVENT_LEVELS = {'call': logging.DEBUG, 'contacts': logging.INFO, 'rate_limited': logging.INFO,
+                'error': logging.WARNING}
+
+
+def classify_error(error):
+    """ maps an exception raised by an API call to a short error class """
+    if isinstance(error, BudgetExhausted):
+        return 'budget'
+    if isinstance(error, tweepy.TooManyRequests):
+        return 'rate_limit'
+    if isinstance(error, tweepy.NotFound):
+        return 'not_found'
+    if isinstance(error, (tweepy.Unauthorized, tweepy.Forbidden)):
+        return 'forbidden'  # protected or suspended accounts, revoked credentials
+    if isinstance(error, tweepy.TwitterServerError):
+        return 'server'
+    if isinstance(error, tweepy.HTTPException):
+        return 'http'
+    if isinstance(error, tweepy.TweepyException):
+        return 'client'  # connection errors and the like
+    return type(error).__name__
+
+
+class LoggingSink:
+    """ writes every event to a logger, calls at DEBUG level, errors at WARNING and the rest at INFO """
+    def __init__(self, logger='graph_scraping'):
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+
+    def __call__(self, event):
+        fields = ' '.join(f'{k}={v}' for k, v in event.items() if k not in ('event', 'time'))
+        self.logger.log(EVENT_LEVELS.get(event['event'], logging.INFO), '%s %s', event['event'], fields)
+
+
+class JSONLinesSink:
+    """ appends every event to a JSON lines file, one object per line """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+class MemorySink:
+    """ keeps every event in a list, e.g. to inspect a crawl from a notebook """
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+
+class CrawlMetrics:
+    """
+        Collects what a crawl spends its time on: calls, latency histogram and errors per endpoint,
+        seconds blocked on rate limits, pages and items fetched and edges produced.
+        Every record is also sent as an event (a flat dictionary) to each sink, so the progress
+        of the scraping functions can go to a logger, a JSON lines file or memory instead of stdout.
+        Thread safe, one instance can be shared by the workers of a CredentialPool.
+
+    :param list sinks: callables receiving every event, defaults to a LoggingSink;
+    :param callable clock: returns the current time in seconds (e.g. a virtual clock in benchmarks).
+    """
+    def __init__(self, sinks=None, clock=time.perf_counter):
+        self.sinks = [LoggingSink()] if sinks is None else list(sinks)
+        self.clock = clock
+        self.calls = Counter()
+        self.latency = defaultdict(lambda: [0] * len(LATENCY_BUCKETS))
+        self.latency_total = Counter()
+        self.errors = Counter()  # (endpoint, error class) -> count
+        self.rate_limited = Counter()  # endpoint -> seconds blocked
+        self.pages = Counter()
+        self.items = Counter()
+        self.edges = 0
+        self.started = clock()
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        """ sends an event to every sink """
+        record = {'event': event, 'time': self.clock(), **fields}
+        for sink in self.sinks:
+            sink(record)
+
+    def record_call(self, endpoint, seconds, items=None, error=None):
+        """ records an API call, the number of items in the page it returned or the exception it raised """
+        with self._lock:
+            self.calls[endpoint] += 1
+            self.latency[endpoint][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latency_total[endpoint] += seconds
+            if items is not None:
+                self.pages[endpoint] += 1
+                self.items[endpoint] += items
+            if error is not None:
+                error = classify_error(error)
+                self.errors[(endpoint, error)] += 1
+        if error is None:
+            self.emit('call', endpoint=endpoint, seconds=seconds, items=items)
+        else:
+            self.emit('error', endpoint=endpoint, seconds=seconds, error=error)
+
+    def record_wait(self, endpoint, seconds):
+        """ records time spent waiting for a rate-limit window to reopen """
+        with self._lock:
+            self.rate_limited[endpoint] += seconds
+        self.emit('rate_limited', endpoint=endpoint, seconds=seconds)
+
+    def record_contacts(self, user, direction, count, **fields):
+        """ records `count` edges between a user and its friends / followers added to the output """
+        with self._lock:
+            self.edges += count
+        self.emit('contacts', user=user, direction=direction, count=count, **fields)
+
+    def record_failure(self, user, stage, error):
+        """ records a user skipped because fetching `stage` raised error """
+        self.emit('error', user=user, stage=stage, error=classify_error(error))
+
+    def summary(self):
+        """ returns the metrics collected so far as a dictionary """
+        with self._lock:
+            elapsed = max(self.clock() - self.started, 1e-9)
+            endpoints = {}
+            for endpoint in sorted(self.calls):
+                endpoints[endpoint] = {
+                    'calls': self.calls[endpoint],
+                    'mean_latency': self.latency_total[endpoint] / self.calls[endpoint],
+                    'latency_histogram': dict(zip(LATENCY_BUCKETS, self.latency[endpoint])),
+                    'rate_limited_seconds': self.rate_limited[endpoint],
+                    'pages': self.pages[endpoint],
+                    'items': self.items[endpoint],
+                    'errors': {e: n for (ep, e), n in self.errors.items() if ep == endpoint},
+                }
+            return {'elapsed_seconds': elapsed,
+                    'calls': sum(self.calls.values()),
+                    'rate_limited_seconds': sum(self.rate_limited.values()),
+                    'pages_per_second': sum(self.pages.values()) / elapsed,
+                    'edges': self.edges,
+                    'edges_per_second': self.edges / elapsed,
+                    'errors': dict(Counter({e: n for (_, e), n in self.errors.items()})),
+                    'endpoints': endpoints}
+
+
+class InstrumentedAPI(EndpointProxy):
+    """
+        Wraps an API instance (or a CredentialPool) recording every endpoint call in a CrawlMetrics:
+        its latency, the size of the page returned and the class of the exception raised, if any.
+        Every other attribute is passed through to the wrapped API.
+
+    :param api: a Twitter API instance or a CredentialPool;
+    :param CrawlMetrics metrics: where the calls are recorded.
+    """
+    def __init__(self, api, metrics):
+        self.api = api
+        self.metrics = metrics
+
+    def _call_endpoint(self, endpoint, method, *args, **kwargs):
+        start = self.metrics.clock()
+        try:
+            response = method(*args, **kwargs)
+        except Exception as error:
+            self.metrics.record_call(endpoint, self.metrics.clock() - start, error=error)
+            raise
+        page = response[0] if isinstance(response, tuple) else response
+        items = len(page) if isinstance(page, list) else None
+        self.metrics.record_call(endpoint, self.metrics.clock() - start, items=items)
+        return response
@@ -0,0 +1,160 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import tweepy
+
+WINDOW = 15 * 60  # length in seconds of a Twitter rate-limit window
+# requests allowed per window to each endpoint with user authentication
+RATE_LIMITS = {
+    'get_user': 900,
+    'lookup_users': 900,
+    'get_friend_ids': 15,
+    'get_follower_ids': 15,
+    'get_friends': 15,
+    'get_followers': 15,
+}
+
+
+class EndpointProxy:
+    """
+        Base of the objects standing in for an API instance (CredentialPool, CachedAPI, InstrumentedAPI, BudgetedAPI):
+        attributes are looked up on `_target()`, and every endpoint method for which `_wraps` is true is replaced
+        by a function of the same name calling `_call_endpoint(endpoint, method, *args, **kwargs)`, tagged so that
+        tweepy.Cursor can still paginate it. Every other attribute is passed through.
+    """
+    def _target(self):
+        return self.api
+
+    def _wraps(self, endpoint):
+        return endpoint not in ('map', 'call')  # the pooling methods of a wrapped CredentialPool
+
+    def _call_endpoint(self, endpoint, method, *args, **kwargs):
+        raise NotImplementedError
+
+    def __getattr__(self, endpoint):
+        if endpoint.startswith('_'):
+            raise AttributeError(endpoint)
+        method = getattr(self._target(), endpoint)
+        if not callable(method) or not self._wraps(endpoint):
+            return method
+
+        def wrapped(*args, **kwargs):
+            return self._call_endpoint(endpoint, method, *args, **kwargs)
+        wrapped.__name__ = endpoint
+        if hasattr(method, 'pagination_mode'):
+            wrapped.pagination_mode = method.pagination_mode  # needed by tweepy.Cursor
+        return wrapped
+
+
+class CredentialPool(EndpointProxy):
+    """
+        Spreads API calls over a pool of credentials, keeping track of the rate-limit window
+        of every credential on every endpoint and sending each request to the credential
+        that becomes free soonest. When every credential is exhausted the calling thread sleeps
+        until the first window reopens, instead of stalling on one token after another.
+
+        The pool exposes the same methods as a single API instance (get_user, get_friend_ids, ...),
+        so it can be passed to tweepy.Cursor and to the scraping functions unchanged;
+        `map` runs a function over many users with one worker thread per credential.
+        The API instances should be created with wait_on_rate_limit=False, the pool does the waiting.
+
+    :param List[tweepy.API] apis: one or more Twitter API instances, each with its own credentials;
+    :param dict rate_limits: requests allowed per window for each endpoint, defaults to RATE_LIMITS;
+    :param float window: length of a rate-limit window in seconds;
+    :param int workers: number of threads used by `map`, defaults to one per credential;
+    :param callable clock: returns the current time in seconds (e.g. a virtual clock in tests);
+    :param callable sleep: blocks for the given number of seconds;
+    :param callable on_wait: called with (endpoint, seconds) before sleeping on a rate limit, e.g. CrawlMetrics.record_wait.
+    """
+    def __init__(self, apis, rate_limits=None, window=WINDOW, workers=None, clock=time.monotonic, sleep=time.sleep,
+                 on_wait=None):
+        self.apis = list(apis)
+        if not self.apis:
+            raise ValueError("A CredentialPool needs at least one API instance")
+        self.rate_limits = dict(RATE_LIMITS if rate_limits is None else rate_limits)
+        self.window = window
+        self.workers = workers or len(self.apis)
+        self.clock = clock
+        self.sleep = sleep
+        self.on_wait = on_wait
+        self._calls = {}  # (credential, endpoint) -> timestamps of the calls in the current window
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.apis)
+
+    def _ready_at(self, i, endpoint, now):
+        """ earliest time at which credential i can call endpoint again """
+        limit = self.rate_limits.get(endpoint)
+        calls = self._calls.setdefault((i, endpoint), deque())
+        while calls and calls[0] + self.window <= now:  # same arithmetic as the ready time below
+            calls.popleft()
+        if limit is None or len(calls) < limit:
+            return now
+        return calls[len(calls) - limit] + self.window
+
+    def _acquire(self, endpoint):
+        """ blocks until a credential can call endpoint, books the call and returns its index """
+        while True:
+            with self._lock:
+                now = self.clock()
+                ready, i = min((self._ready_at(i, endpoint, now), i) for i in range(len(self.apis)))
+                if ready <= now:
+                    self._calls[(i, endpoint)].append(now)
+                    return i
+            wait = max(ready - self.clock(), 0)
+            if self.on_wait is not None:
+                self.on_wait(endpoint, wait)
+            self.sleep(wait)
+
+    def _exhaust(self, i, endpoint):
+        """ marks the window of credential i on endpoint as full after an unexpected 429 """
+        with self._lock:
+            now = self.clock()
+            limit = self.rate_limits.get(endpoint) or 1
+            self._calls[(i, endpoint)] = deque([now] * limit)
+
+    def call(self, endpoint, *args, **kwargs):
+        """ calls `endpoint` on the credential that is free soonest, retrying if Twitter answers 429 """
+        while True:
+            i = self._acquire(endpoint)
+            try:
+                return getattr(self.apis[i], endpoint)(*args, **kwargs)
+            except tweepy.TooManyRequests:
+                self._exhaust(i, endpoint)
+
+    def _target(self):
+        return self.apis[0]
+
+    def _call_endpoint(self, endpoint, method, *args, **kwargs):
+        return self.call(endpoint, *args, **kwargs)
+
+    def map(self, fn, items):
+        """ applies fn to every item using `workers` threads, results are returned in order """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(fn, items)
+
+
+def as_pool(api, on_wait=None):
+    """
+    turns an API instance or a list of them into a CredentialPool, so that the rate-limit waits of a single
+    credential are also scheduled by the pool and reported to on_wait; anything already pooling its calls
+    (a CredentialPool or a wrapper around one) is returned untouched. Credentials running on simulated time,
+    such as FakeTwitterAPI, are scheduled on their own clock
+    """
+    if getattr(api, 'map', None) is not None:
+        return api
+    apis = list(api) if isinstance(api, (list, tuple)) else [api]
+    clock = getattr(apis[0], 'clock', None)
+    if hasattr(clock, 'now') and hasattr(clock, 'sleep'):
+        return CredentialPool(apis, clock=clock.now, sleep=clock.sleep, on_wait=on_wait)
+    return CredentialPool(apis, on_wait=on_wait)
+
+
+def map_users(api, fn, user_list):
+    """ applies fn to every user, concurrently when api is (or wraps) a CredentialPool """
+    mapper = getattr(api, 'map', None)
+    if mapper is not None:
+        return mapper(fn, user_list)
+    return map(fn, user_list)
@@ -0,0 +1,139 @@
+import os
+import glob
+from array import array
+import numpy as np
+import pandas as pd
+
+
+class EdgeSink:
+    """
+        Accumulates (source, target) relationships into typed column buffers instead of
+        growing a DataFrame one user at a time.
+
+        IDs are kept in two flat int64 arrays (screen names in two plain lists when dtype='object');
+        once the buffers hold chunk_size edges they are written to disk as a numbered partition
+        and emptied, so memory stays flat no matter how many edges a crawl collects.
+        Partitions already in `path` are kept and counted as part of the sink,
+        which lets an interrupted crawl keep appending to the same directory.
+
+    :param str path: directory where partitions are written; if None every edge stays in memory;
+    :param str fmt: format of the partitions, either 'parquet' or 'csv';
+    :param int chunk_size: number of edges buffered in memory before a partition is flushed;
+    :param str dtype: 'int64' for user IDs, 'object' for screen names.
+    """
+    def __init__(self, path=None, fmt='parquet', chunk_size=1_000_000, dtype='int64'):
+        if fmt not in ('parquet', 'csv'):
+            raise ValueError("Unknown format: fmt should be one of 'parquet', 'csv'")
+        if dtype not in ('int64', 'object'):
+            raise ValueError("Unknown dtype: dtype should be one of 'int64', 'object'")
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+        self.partitions = []
+        self.flushed = 0  # number of edges already written to disk
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self.partitions = sorted(glob.glob(os.path.join(path, f'part-*.{fmt}')))
+            self.flushed = sum(self._count_rows(part) for part in self.partitions)
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        if self.dtype == 'int64':
+            self._sources = array('q')
+            self._targets = array('q')
+        else:
+            self._sources = []
+            self._targets = []
+
+    def __len__(self):
+        """ number of edges collected so far, both flushed and buffered """
+        return self.flushed + len(self._sources)
+
+    def add_targets(self, source, targets):
+        """ records that `source` follows every profile in `targets` """
+        self._sources.extend([source] * len(targets))
+        self._targets.extend(targets)
+        self._maybe_flush()
+
+    def add_sources(self, sources, target):
+        """ records that every profile in `sources` follows `target` """
+        self._sources.extend(sources)
+        self._targets.extend([target] * len(sources))
+        self._maybe_flush()
+
+    def add_edges(self, sources, targets):
+        """ records that sources[i] follows targets[i] for every i, e.g. a batch yielded by iter_contacts """
+        if len(sources) != len(targets):
+            raise ValueError("sources and targets should have the same length")
+        if self.dtype == 'int64':
+            self._sources.frombytes(np.asarray(sources, dtype=np.int64).tobytes())
+            self._targets.frombytes(np.asarray(targets, dtype=np.int64).tobytes())
+        else:
+            self._sources.extend(sources)
+            self._targets.extend(targets)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self.path is not None and len(self._sources) >= self.chunk_size:
+            self.flush()
+
+    def _buffer_frame(self):
+        """ wraps the in-memory buffers into a two-column DataFrame without copying them twice """
+        if self.dtype == 'int64':
+            return pd.DataFrame({'source': np.frombuffer(self._sources, dtype=np.int64),
+                                 'target': np.frombuffer(self._targets, dtype=np.int64)})
+        return pd.DataFrame({'source': pd.Series(self._sources, dtype=object),
+                             'target': pd.Series(self._targets, dtype=object)})
+
+    def flush(self):
+        """ writes the buffered edges as a new partition and empties the buffers """
+        if self.path is None or len(self._sources) == 0:
+            return
+        part = os.path.join(self.path, f'part-{len(self.partitions):05d}.{self.fmt}')
+        chunk = self._buffer_frame()
+        if self.fmt == 'parquet':
+            chunk.to_parquet(part, index=False)
+        else:
+            chunk.to_csv(part, index=False)
+        self.partitions.append(part)
+        self.flushed += len(chunk)
+        self._reset_buffers()
+
+    def truncate(self, n_partitions):
+        """ deletes every partition after the first n_partitions, e.g. to roll back to a crawl checkpoint """
+        for part in self.partitions[n_partitions:]:
+            self.flushed -= self._count_rows(part)
+            os.remove(part)
+        self.partitions = self.partitions[:n_partitions]
+
+    def _read_partition(self, part):
+        if self.fmt == 'parquet':
+            return pd.read_parquet(part)
+        # screen names such as 'NA' or 'null' are names, not missing values
+        return pd.read_csv(part, dtype=self.dtype, keep_default_na=False, na_values=[])
+
+    def _count_rows(self, part):
+        """ number of edges in a partition, from the Parquet footer or the CSV lines, without parsing them """
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.read_metadata(part).num_rows
+        with open(part, 'rb') as f:
+            return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b'')) - 1
+
+    def iter_frames(self):
+        """ yields the collected edges one partition at a time, buffered edges last """
+        for part in self.partitions:
+            yield self._read_partition(part)
+        if len(self._sources):
+            yield self._buffer_frame().copy()
+
+    def to_frame(self):
+        """
+        returns every collected edge as a single DataFrame with 'source' and 'target' columns;
+        partitions are read lazily and concatenated in a single pass
+        """
+        if not self.partitions and not len(self._sources):
+            return pd.DataFrame({'source': pd.Series(dtype=self.dtype),
+                                 'target': pd.Series(dtype=self.dtype)})
+        return pd.concat(self.iter_frames(), ignore_index=True)
@@ -0,0 +1,224 @@
+import json
+import threading
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import requests
+import tweepy
+from credential_pool_utils import RATE_LIMITS, WINDOW
+
+# page sizes of the real endpoints
+ID_PAGE_SIZE = 5000
+USER_PAGE_SIZE = 20  # default count of get_friends / get_followers (max 200)
+MAX_USER_PAGE_SIZE = 200
+LOOKUP_SIZE = 100
+
+
+class VirtualClock:
+    """
+        Simulated time, so that 15-minute rate-limit windows cost nothing to wait for.
+        Calls running on several threads at once overlap instead of adding up: `advance` moves the clock
+        to the latest time any of them reached.
+    """
+    def __init__(self, start=0.0):
+        self.time = start
+        self._lock = threading.Lock()
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.advance(self.now(), seconds)
+
+    def advance(self, since, seconds):
+        """ moves the clock to since + seconds, unless another thread already went further """
+        with self._lock:
+            self.time = max(self.time, since + seconds)
+
+
+class FakeUser:
+    """ the subset of a tweepy User used by the scraping functions """
+    def __init__(self, graph, user_id):
+        self.id = int(user_id)
+        self.screen_name = f'user{user_id}'
+        self.description = f'synthetic account {user_id}'
+        self.friends_count = int(graph.friends_indptr[user_id + 1] - graph.friends_indptr[user_id])
+        self.followers_count = int(graph.followers_indptr[user_id + 1] - graph.followers_indptr[user_id])
+        self.statuses_count = int(graph.statuses[user_id])
+        self.created_at = graph.epoch - timedelta(days=int(graph.age_days[user_id]))
+
+
+class FakeTwitterGraph:
+    """
+        Synthetic follow graph with power-law degrees: every user follows a Pareto-distributed number of accounts,
+        picked with probability proportional to a Zipf popularity, so a few accounts have huge follower lists
+        and most have a handful, as on Twitter. Friends and followers are kept as CSR arrays.
+
+    :param int n_users: number of accounts, with IDs 0 .. n_users - 1;
+    :param float mean_friends: average number of accounts followed by a user;
+    :param float exponent: Zipf exponent of the popularity of the accounts;
+    :param int seed: seed of the random generator.
+    """
+    def __init__(self, n_users=10_000, mean_friends=100, exponent=1.0, seed=0):
+        rng = np.random.default_rng(seed)
+        self.n_users = n_users
+        out_degree = np.minimum((rng.pareto(2.0, n_users) + 1) * mean_friends / 2, n_users - 1).astype(np.int64)
+        popularity = 1.0 / np.arange(1, n_users + 1) ** exponent
+        popularity = popularity[rng.permutation(n_users)] / popularity.sum()
+        sources = np.repeat(np.arange(n_users), out_degree)
+        targets = rng.choice(n_users, size=len(sources), p=popularity)
+        keep = sources != targets
+        edges = np.unique(sources[keep] * n_users + targets[keep])
+        sources, targets = edges // n_users, edges % n_users
+        self.friends_indptr, self.friends = self._csr(sources, targets)
+        order = np.lexsort((sources, targets))
+        self.followers_indptr, self.followers = self._csr(targets[order], sources[order])
+        self.statuses = rng.integers(0, 50_000, n_users)
+        self.age_days = rng.integers(1, 5_000, n_users)
+        self.epoch = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    def _csr(self, rows, cols):
+        indptr = np.zeros(self.n_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.n_users), out=indptr[1:])
+        return indptr, cols
+
+    @property
+    def n_edges(self):
+        return len(self.friends)
+
+    def friend_ids(self, user_id):
+        return self.friends[self.friends_indptr[user_id]:self.friends_indptr[user_id + 1]]
+
+    def follower_ids(self, user_id):
+        return self.followers[self.followers_indptr[user_id]:self.followers_indptr[user_id + 1]]
+
+
+def _http_error(error, status_code, reason, message, headers=None):
+    """ builds the exception tweepy raises when Twitter answers with an error """
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = reason
+    response.headers.update(headers or {})
+    response._content = json.dumps({'errors': [{'message': message}]}).encode()
+    return error(response)
+
+
+class FakeTwitterAPI:
+    """
+        Local stand-in for a tweepy.API instance (one set of credentials) answering from a FakeTwitterGraph.
+
+        Cursored endpoints paginate with the real page sizes and return (page, (previous, next)) cursors
+        like tweepy does when a cursor is passed; every endpoint enforces its 15-minute rate limit on a
+        VirtualClock, either sleeping until the window reopens (wait_on_rate_limit=True, as tweepy)
+        or raising tweepy.TooManyRequests. Every call is counted per endpoint and costs `latency` simulated seconds.
+
+    :param FakeTwitterGraph graph: the follow graph, shared by every fake credential;
+    :param VirtualClock clock: the simulated time, shared by every fake credential;
+    :param bool wait_on_rate_limit: whether to sleep or raise when a rate limit is hit;
+    :param float latency: simulated seconds taken by each call;
+    :param dict rate_limits: requests allowed per window for each endpoint.
+    """
+    def __init__(self, graph, clock=None, wait_on_rate_limit=True, latency=0.2, rate_limits=None):
+        self.graph = graph
+        self.clock = clock or VirtualClock()
+        self.wait_on_rate_limit = wait_on_rate_limit
+        self.latency = latency
+        self.rate_limits = dict(RATE_LIMITS if rate_limits is None else rate_limits)
+        self.calls = Counter()
+        self.rate_limited = 0.0  # simulated seconds spent waiting for a window to reopen
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def _call(self, endpoint):
+        """ enforces the rate limit of endpoint, then counts the call and its latency """
+        with self._lock:
+            now = self.clock.now()
+            window = self._windows.setdefault(endpoint, deque())
+            while window and window[0] + WINDOW <= now:
+                window.popleft()
+            limit = self.rate_limits.get(endpoint)
+            if limit is not None and len(window) >= limit:
+                reset = window[len(window) - limit] + WINDOW
+                if not self.wait_on_rate_limit:
+                    raise _http_error(tweepy.TooManyRequests, 429, 'Too Many Requests', 'Rate limit exceeded',
+                                      {'x-rate-limit-reset': str(int(reset))})
+                self.rate_limited += reset - now
+                self.clock.advance(now, reset - now)
+                now = reset
+                while window and window[0] + WINDOW <= now:
+                    window.popleft()
+            window.append(now)
+            self.calls[endpoint] += 1
+        self.clock.advance(now, self.latency)
+
+    def _user_id(self, user_id=None, screen_name=None):
+        try:
+            user_id = int(user_id if user_id is not None else str(screen_name).lower().replace('user', '', 1))
+        except ValueError:
+            user_id = -1
+        if not 0 <= user_id < self.graph.n_users:
+            raise _http_error(tweepy.NotFound, 404, 'Not Found', 'User not found.')
+        return user_id
+
+    def _page(self, items, cursor, size, with_cursors):
+        start = 0 if cursor in (None, -1) else int(cursor)
+        page = items[start:start + size]
+        next_cursor = start + size if start + size < len(items) else 0
+        if with_cursors:
+            return page, (start, next_cursor)
+        return page
+
+    def get_user(self, *, user_id=None, screen_name=None, **kwargs):
+        self._call('get_user')
+        return FakeUser(self.graph, self._user_id(user_id, screen_name))
+
+    def lookup_users(self, *, user_id=None, screen_name=None, **kwargs):
+        self._call('lookup_users')
+        if user_id is not None:
+            keys = [('user_id', u) for u in list(user_id)[:LOOKUP_SIZE]]
+        else:
+            keys = [('screen_name', u) for u in list(screen_name)[:LOOKUP_SIZE]]
+        users = []
+        for key, value in keys:
+            try:
+                users.append(FakeUser(self.graph, self._user_id(**{key: value})))
+            except tweepy.NotFound:
+                continue  # missing accounts are left out, as Twitter does
+        if not users:
+            raise _http_error(tweepy.NotFound, 404, 'Not Found', 'No user matches for specified terms.')
+        return users
+
+    def get_friend_ids(self, *, user_id=None, screen_name=None, cursor=None, count=ID_PAGE_SIZE, **kwargs):
+        self._call('get_friend_ids')
+        ids = self.graph.friend_ids(self._user_id(user_id, screen_name)).tolist()
+        return self._page(ids, cursor, min(count, ID_PAGE_SIZE), cursor is not None)
+
+    def get_follower_ids(self, *, user_id=None, screen_name=None, cursor=None, count=ID_PAGE_SIZE, **kwargs):
+        self._call('get_follower_ids')
+        ids = self.graph.follower_ids(self._user_id(user_id, screen_name)).tolist()
+        return self._page(ids, cursor, min(count, ID_PAGE_SIZE), cursor is not None)
+
+    def get_friends(self, *, user_id=None, screen_name=None, cursor=None, count=USER_PAGE_SIZE, **kwargs):
+        self._call('get_friends')
+        ids = self.graph.friend_ids(self._user_id(user_id, screen_name))
+        page = self._page(ids, cursor, min(count, MAX_USER_PAGE_SIZE), True)
+        users = [FakeUser(self.graph, i) for i in page[0]]
+        return (users, page[1]) if cursor is not None else users
+
+    def get_followers(self, *, user_id=None, screen_name=None, cursor=None, count=USER_PAGE_SIZE, **kwargs):
+        self._call('get_followers')
+        ids = self.graph.follower_ids(self._user_id(user_id, screen_name))
+        page = self._page(ids, cursor, min(count, MAX_USER_PAGE_SIZE), True)
+        users = [FakeUser(self.graph, i) for i in page[0]]
+        return (users, page[1]) if cursor is not None else users
+
+
+# tweepy.Cursor only paginates methods tagged like the ones of tweepy.API
+for _endpoint in ('get_friend_ids', 'get_follower_ids', 'get_friends', 'get_followers'):
+    getattr(FakeTwitterAPI, _endpoint).pagination_mode = 'cursor'
+
+
+def fake_credentials(n, graph, clock=None, **kwargs):
+    """ returns n FakeTwitterAPI instances (one per simulated token) sharing the same graph and clock """
+    clock = clock or VirtualClock()
+    return [FakeTwitterAPI(graph, clock, **kwargs) for _ in range(n)]
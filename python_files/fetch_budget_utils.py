@@ -0,0 +1,130 @@
+import threading
+import numpy as np
+import pandas as pd
+import tweepy
+from credential_pool_utils import EndpointProxy
+
+
+class BudgetExhausted(tweepy.TweepyException):
+    """ raised instead of calling the API once the call budget of a crawl is spent """
+
+
+class ReservoirSampler:
+    """
+        Uniform sample of at most k items out of a stream of pages (Algorithm R), so that a large account
+        can be sampled page by page without keeping every ID in memory.
+
+    :param int k: size of the sample;
+    :param np.random.Generator rng: random generator driving the sample.
+    """
+    def __init__(self, k, rng):
+        self.k = k
+        self.rng = rng
+        self.seen = 0
+        self._sample = np.empty(k, dtype=np.int64)
+
+    def add(self, page):
+        page = np.asarray(page, dtype=np.int64)
+        fill = min(max(self.k - self.seen, 0), len(page))
+        self._sample[self.seen:self.seen + fill] = page[:fill]
+        if fill < len(page):
+            # item t (0-based) of the stream replaces a random slot with probability k / (t + 1)
+            t = self.seen + np.arange(fill, len(page))
+            slots = self.rng.integers(0, t + 1)
+            for slot, item in zip(slots[slots < self.k], page[fill:][slots < self.k]):
+                self._sample[slot] = item
+        self.seen += len(page)
+
+    @property
+    def sample(self):
+        return self._sample[:min(self.seen, self.k)].copy()
+
+
+class FetchBudget:
+    """
+        Caps the cost of a crawl: at most max_pages pages of IDs (5000 each) per user and direction,
+        at most max_calls API calls in total, and optionally a uniform reservoir sample of sample_size
+        contacts for accounts that have more than that.
+
+        Sampled accounts are still read for max_pages pages (None: every page), so the sample is uniform
+        over the contacts those pages cover, instead of being the most recent ones only. Every account whose
+        contacts were cut, by the page limit, by sampling or by running out of calls, is recorded with the
+        fraction kept; `report` returns them as a DataFrame, which the scraping functions also attach to
+        their output as frame.attrs['sampling']. One budget can be shared by several calls of the scraping functions.
+
+    :param int max_pages: pages of IDs fetched per user and direction, None for no limit;
+    :param int max_calls: API calls allowed for the whole crawl, None for no limit;
+    :param int sample_size: number of contacts sampled from larger accounts, None to keep the first pages;
+    :param int seed: seed of the reservoir samples.
+    """
+    def __init__(self, max_pages=1, max_calls=None, sample_size=None, seed=0):
+        self.max_pages = max_pages
+        self.max_calls = max_calls
+        self.sample_size = sample_size
+        self.seed = seed
+        self.calls = 0
+        self.records = []
+        self._cut = set()  # (user, direction) of the records
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.max_calls is not None and self.calls >= self.max_calls
+
+    def charge(self, endpoint):
+        """ books one call to endpoint, raising BudgetExhausted if the crawl can't make any more """
+        with self._lock:
+            if self.exhausted:
+                raise BudgetExhausted(f"Call budget of {self.max_calls} calls exhausted, {endpoint} not called")
+            self.calls += 1
+
+    def sampler(self, user_id, direction):
+        """ returns a reservoir sampler for the contacts of a user, seeded by the user so crawls are repeatable """
+        rng = np.random.default_rng([self.seed, int(user_id), direction == 'followers'])
+        return ReservoirSampler(self.sample_size, rng)
+
+    def record(self, user_id, direction, count, kept, method):
+        """ records that only `kept` of the `count` contacts of a user were fetched (count None if unknown) """
+        fraction = 0.0 if count is None else min(kept / count, 1.0) if count else 1.0
+        with self._lock:
+            self.records.append({'user': user_id, 'direction': direction, 'count': count, 'kept': kept,
+                                 'fraction': fraction, 'method': method})
+            self._cut.add((user_id, direction))
+
+    def merge(self, records):
+        """ adds records of another budget (e.g. restored from a checkpoint), skipping users already recorded """
+        with self._lock:
+            for record in records:
+                if (record['user'], record['direction']) not in self._cut:
+                    self.records.append(dict(record))
+                    self._cut.add((record['user'], record['direction']))
+
+    def was_cut(self, user_id, direction):
+        """ whether the contacts of a user were recorded as cut """
+        with self._lock:
+            return (user_id, direction) in self._cut
+
+    def report(self):
+        """
+        returns the users whose contacts were cut, with 'user', 'direction', 'count', 'kept', 'fraction'
+        and 'method' ('first_pages', 'reservoir' or 'budget' when the calls ran out before the user was done) cols
+        """
+        with self._lock:
+            return pd.DataFrame(self.records, columns=['user', 'direction', 'count', 'kept', 'fraction', 'method'])
+
+
+class BudgetedAPI(EndpointProxy):
+    """
+        Wraps an API instance (or a CredentialPool) charging every endpoint call to a FetchBudget,
+        every other attribute is passed through to the wrapped API.
+
+    :param api: a Twitter API instance or a CredentialPool;
+    :param FetchBudget budget: the budget the calls are charged to.
+    """
+    def __init__(self, api, budget):
+        self.api = api
+        self.budget = budget
+
+    def _call_endpoint(self, endpoint, method, *args, **kwargs):
+        self.budget.charge(endpoint)
+        return method(*args, **kwargs)
@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class FollowSnapshotStore:
+    """
+        Keeps the last known state of the friends / followers of each user on disk,
+        one .npz file per user and direction (path/friends/<userID>.npz, path/followers/<userID>.npz).
+
+        A snapshot holds the friends_count / followers_count reported by Twitter, the first page of IDs
+        (most recent contacts first) and the sorted set of every ID fetched, which is all an incremental
+        refresh needs to decide whether a user changed and which edges were added or removed.
+
+    :param str path: directory where the snapshots are stored.
+    """
+    def __init__(self, path):
+        self.path = path
+        for direction in ('friends', 'followers'):
+            os.makedirs(os.path.join(path, direction), exist_ok=True)
+
+    def _file(self, user_id, direction):
+        return os.path.join(self.path, direction, f'{user_id}.npz')
+
+    def load(self, user_id, direction):
+        """ returns the snapshot of a user as a dictionary, None if the user was never seen """
+        file = self._file(user_id, direction)
+        if not os.path.exists(file):
+            return None
+        with np.load(file) as snapshot:
+            return {'count': int(snapshot['count']), 'first_page': snapshot['first_page'], 'ids': snapshot['ids']}
+
+    def save(self, user_id, direction, count, first_page, ids):
+        """ replaces the snapshot of a user """
+        tmp = self._file(user_id, direction) + '.tmp.npz'
+        np.savez(tmp, count=count, first_page=np.asarray(first_page, dtype=np.int64),
+                 ids=np.unique(np.asarray(ids, dtype=np.int64)))
+        os.replace(tmp, self._file(user_id, direction))
+
+
+def diff_ids(old_ids, new_ids):
+    """ returns the (added, removed) IDs between two snapshots """
+    new_ids = np.unique(np.asarray(new_ids, dtype=np.int64))
+    if old_ids is None:
+        return new_ids, np.empty(0, dtype=np.int64)
+    return np.setdiff1d(new_ids, old_ids, assume_unique=True), np.setdiff1d(old_ids, new_ids, assume_unique=True)
+
+
+def diff_window(old_ids, new_ids):
+    """
+    returns the (added, removed) IDs of a list that was cut after its first pages (most recent contacts first):
+    only the IDs ahead of the most recent known one are added, and none is removed, since IDs missing from
+    the window may just have been pushed out of it, and IDs entering it at the end may have slid in from beyond
+    """
+    new_ids = np.asarray(new_ids, dtype=np.int64)
+    if old_ids is not None:
+        known = np.isin(new_ids, old_ids)
+        if known.any():
+            new_ids = new_ids[:known.argmax()]
+    return np.unique(new_ids), np.empty(0, dtype=np.int64)
+
+
+def delta_frame(sources, targets, changes):
+    """ builds the delta DataFrame from lists of source, target and change arrays """
+    if not sources:
+        return pd.DataFrame({'source': pd.Series(dtype='int64'), 'target': pd.Series(dtype='int64'),
+                             'change': pd.Series(dtype='object')})
+    return pd.DataFrame({'source': np.concatenate(sources), 'target': np.concatenate(targets),
+                         'change': np.concatenate(changes)})
@@ -1,7 +1,359 @@
+import os
+import math
+import queue
+import threading
 import tweepy
+import numpy as np
 import pandas as pd
+from datetime import datetime, timezone
+from edge_sink_utils import EdgeSink
+from credential_pool_utils import as_pool, map_users
+from response_cache_utils import CachedAPI
+from crawl_frontier_utils import CrawlFrontier
+from user_hydration_utils import UserHydrator
+from follow_delta_utils import FollowSnapshotStore, diff_ids, diff_window, delta_frame
+from crawl_metrics_utils import CrawlMetrics, InstrumentedAPI
+from fetch_budget_utils import FetchBudget, BudgetedAPI, BudgetExhausted
+from monitor_store_utils import typed_snapshot
 
-def fetch_contacts(api, user_list, contacts):
+_DIRECTIONS = {'get_friend_ids': 'friends', 'get_follower_ids': 'followers'}
+
+
+def _client(api, cache=None, metrics=None, budget=None):
+    """
+    pools an API instance or a list of them, records their calls in metrics, charges them to the budget
+    and puts the response cache in front of them (cache hits are free);
+    the credentials are instrumented one by one, so that the time the pool spends waiting
+    for a rate-limit window is recorded apart from the latency of the calls (with a CredentialPool
+    built by the caller the waits are part of the latency, unless it reports them with on_wait)
+    """
+    if metrics is not None:
+        if getattr(api, 'map', None) is not None: # already pooled
+            api = InstrumentedAPI(api, metrics)
+        else:
+            api = [InstrumentedAPI(a, metrics) for a in (api if isinstance(api, (list, tuple)) else [api])]
+    api = as_pool(api, None if metrics is None else metrics.record_wait)
+    if budget is not None:
+        api = BudgetedAPI(api, budget)
+    if cache is not None:
+        api = CachedAPI(api, cache)
+    return api
+
+
+def _iter_pages(method, count, budget, max_pages=None, kept=0, **kwargs):
+    """
+    yields the pages returned by a cursored endpoint (e.g. api.get_friend_ids) as they arrive,
+    at most budget.max_pages of them (max_pages, if given); the contacts of accounts with more than
+    budget.sample_size of them are reservoir-sampled instead and yielded as a single page at the end.
+    Accounts whose contacts are cut are recorded in the budget, counting the `kept` contacts
+    already fetched when the pages start from a later cursor
+    """
+    if max_pages is None:
+        max_pages = budget.max_pages
+    pages = tweepy.Cursor(method, **kwargs).pages(math.inf if max_pages is None else max_pages)
+    user_id, direction = kwargs.get('user_id'), _DIRECTIONS.get(method.__name__, method.__name__)
+    if budget.sample_size is not None and count > budget.sample_size:
+        sampler = budget.sampler(user_id, direction)
+        for page in pages:
+            sampler.add(page)
+        sample = sampler.sample
+        budget.record(user_id, direction, count, len(sample), 'reservoir')
+        yield sample.tolist()
+        return
+    for page in pages:
+        kept += len(page)
+        yield page
+    if getattr(pages, 'next_cursor', 0): # stopped by the page limit before the last page
+        budget.record(user_id, direction, count, kept, 'first_pages')
+
+def _fetch_pages(method, count, budget, metrics=None, max_pages=None, kept=0, **kwargs):
+    """
+    collects every page returned by a cursored endpoint (e.g. api.get_friend_ids) within the budget,
+    see _iter_pages; returns None if the API raised an error, which is recorded in metrics
+    """
+    items = []
+    try:
+        for page in _iter_pages(method, count, budget, max_pages, kept, **kwargs):
+            items.extend(page)
+    except tweepy.TweepyException as error:
+        if metrics is not None:
+            metrics.record_failure(kwargs.get('user_id'), method.__name__, error)
+        return None
+    return items
+
+
+def _record_unfetched(budget, user_id, user, fetched):
+    """
+    records in the budget the directions of a user left unfetched (None in the fetched dictionary,
+    direction -> IDs) because its calls ran out, so that the output tells which contacts are missing
+    """
+    if not budget.exhausted:
+        return
+    for direction, ids in fetched.items():
+        if ids is None:
+            count = None if user is None else getattr(user, direction + '_count')
+            budget.record(user_id, direction, count, 0, 'budget')
+
+def _fetch_first_page(method, metrics=None, **kwargs):
+    """ returns the first page of a cursored endpoint and the cursor of the next one, (None, 0) on errors """
+    try:
+        page, (_, next_cursor) = method(cursor=-1, **kwargs)
+    except tweepy.TweepyException as error:
+        if metrics is not None:
+            metrics.record_failure(kwargs.get('user_id'), method.__name__, error)
+        return None, 0
+    return list(page), next_cursor
+
+
+def _get_user(api, user_id, metrics):
+    """
+    returns the profile of a user, None if it can't be fetched (e.g. a suspended account), which is recorded
+    in metrics as a failure; BudgetExhausted is raised instead, running out of calls is not a failure of the user
+    """
+    try:
+        return api.get_user(user_id=user_id)
+    except BudgetExhausted:
+        raise
+    except tweepy.TweepyException as error:
+        metrics.record_failure(user_id, 'get_user', error)
+        return None
+
+def _contact_batches(api, user, mode, budget, metrics, hold=False):
+    """
+    yields (user, direction, sources, targets) for every page of friends / followers of user, as int64 arrays,
+    and returns the directions left unfinished because the calls ran out, mapped to the number of contacts
+    fetched before; a direction stops at its first other error, which is recorded in metrics.
+    With hold=True the pages are yielded once the user is complete, and none if the calls ran out
+    """
+    unfinished, held = {}, []
+    for direction, method in (('friends', api.get_friend_ids), ('followers', api.get_follower_ids)):
+        if mode not in (direction, 'all'):
+            continue
+        if unfinished: # no calls left
+            unfinished[direction] = 0
+            continue
+        kept = 0
+        try:
+            for page in _iter_pages(method, getattr(user, direction + '_count'), budget, user_id=user.id):
+                page = np.asarray(page, dtype=np.int64)
+                kept += len(page)
+                seed = np.full(len(page), user.id, dtype=np.int64)
+                if direction == 'friends': # the user follows its friends
+                    batch = user, direction, seed, page
+                else: # the user is followed by its followers
+                    batch = user, direction, page, seed
+                if hold:
+                    held.append(batch)
+                else:
+                    yield batch
+        except BudgetExhausted:
+            unfinished[direction] = kept
+        except tweepy.TweepyException as error:
+            metrics.record_failure(user.id, method.__name__, error)
+    if not unfinished:
+        yield from held
+    return unfinished
+
+def _stream(api, batches_of, items, buffer=None):
+    """
+    yields every batch produced by the generator batches_of(item) for each item; with a CredentialPool
+    the items are processed by `api.workers` threads handing their batches over through a queue
+    of at most `buffer` batches (two per worker by default), so slow consumers hold the crawl back
+    instead of letting pages pile up in memory
+    """
+    workers = getattr(api, 'workers', 1)
+    if workers <= 1:
+        for item in items:
+            yield from batches_of(item)
+        return
+
+    batches = queue.Queue(maxsize=buffer or 2 * workers)
+    items, lock, stop, done = iter(items), threading.Lock(), threading.Event(), object()
+
+    def put(batch):
+        while not stop.is_set(): # give up if the consumer went away
+            try:
+                batches.put(batch, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work():
+        try:
+            while not stop.is_set():
+                with lock:
+                    item = next(items, done)
+                if item is done:
+                    break
+                for batch in batches_of(item):
+                    if not put(batch):
+                        return
+        except Exception as error:
+            put(error)
+        finally:
+            put(done)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    finished = 0
+    try:
+        while finished < workers:
+            batch = batches.get()
+            if batch is done:
+                finished += 1
+            elif isinstance(batch, Exception):
+                raise batch
+            else:
+                yield batch
+    finally:
+        stop.set()
+
+def iter_contacts(api, user_list, contacts, cache=None, metrics=None, buffer=None, budget=None):
+    """
+        Streaming version of fetch_contacts: yields the relationships of the users in the list page by page,
+        as soon as each page of IDs is fetched, instead of returning all of them at the end.
+
+        Every batch is a (sources, targets) pair of int64 arrays, the profile sources[i] following targets[i].
+        Memory is bounded by the page size: with a CredentialPool users are fetched concurrently and
+        at most `buffer` pages wait for the consumer. Pages fetched before an error are already yielded;
+        users whose profile can't be fetched are skipped and recorded in metrics as failures, and the ones left
+        once the budget is spent are listed by budget.report(). Batches can be fed to a CSRGraphBuilder
+        or an EdgeSink with stream_to, e.g. to analyse the network while the crawl is still running.
+
+    :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
+    :param list user_list: a list of userIDs to fetch friends and followers from;
+    :param str contacts: 'friends', 'followers' or 'all', as in fetch_contacts;
+    :param ResponseCache cache: answers repeated calls from disk instead of the API, if given;
+    :param CrawlMetrics metrics: records calls, waits, errors and progress; defaults to one logging the progress;
+    :param int buffer: maximum number of pages waiting for the consumer, two per worker by default;
+    :param FetchBudget budget: pages per user, total calls and sampling of large accounts; defaults to
+        FetchBudget(), i.e. the first page of 5000 IDs of every user;
+        the users whose contacts were cut are listed by budget.report();
+    :return: a generator of (sources, targets) arrays.
+    """
+    if contacts not in ('friends', 'followers', 'all'):
+        raise ValueError("Unknown mode: contacts should be one of 'friends', 'followers', 'all'")
+    if metrics is None:
+        metrics = CrawlMetrics()
+    if budget is None:
+        budget = FetchBudget()
+    api = _client(api, cache, metrics, budget)
+
+    directions = [d for d in ('friends', 'followers') if contacts in (d, 'all')]
+
+    def user_batches(userID):
+        try:
+            user = _get_user(api, userID, metrics)
+        except BudgetExhausted:
+            _record_unfetched(budget, userID, None, dict.fromkeys(directions))
+            return
+        if user is None:
+            return
+        unfinished = yield from _contact_batches(api, user, contacts, budget, metrics)
+        for direction, kept in unfinished.items():
+            budget.record(user.id, direction, getattr(user, direction + '_count'), kept, 'budget')
+
+    for user, direction, sources, targets in _stream(api, user_batches, user_list, buffer):
+        metrics.record_contacts(user.screen_name, direction, len(sources))
+        yield sources, targets
+
+def iter_network(api, userID, depth=2, contacts='friends', priority='proximity', max_users=None,
+                 cache=None, metrics=None, buffer=None, budget=None):
+    """
+        Streaming version of fetch_network: crawls the network of userID in the same order,
+        yielding its relationships page by page as (sources, targets) int64 arrays (sources[i] follows targets[i])
+        as soon as they are fetched. The frontier grows as the pages arrive, so only the frontier and
+        the visited profiles are kept in memory. Use fetch_network to checkpoint and resume long crawls.
+        Profiles that can't be fetched are skipped, as in iter_contacts; with a call budget the pages
+        of a profile are yielded once it is complete, and a profile cut by the budget yields none.
+
+    :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
+    :param int userID: the ID of the user whose network is fetched;
+    :param int depth: profiles up to depth - 1 hops away from the seed get their contacts fetched;
+    :param str contacts: the kind of contacts fetched for profiles other than the seed ('friends', 'followers', 'all');
+    :param str priority: order of the crawl, 'proximity' (breadth first) or 'degree' (most linked profiles first);
+    :param int max_users: maximum number of profiles whose contacts are fetched, no limit if None;
+    :param ResponseCache cache: answers repeated calls from disk instead of the API, if given;
+    :param CrawlMetrics metrics: records calls, waits, errors and progress; defaults to one logging the progress;
+    :param int buffer: maximum number of pages waiting for the consumer, two per worker by default;
+    :param FetchBudget budget: pages per user, total calls and sampling of large accounts; defaults to
+        FetchBudget(), i.e. the first page of 5000 IDs of every user;
+        the crawl stops when its calls are spent and the users whose contacts were cut are listed by budget.report();
+    :return: a generator of (sources, targets) arrays.
+    """
+    if contacts not in ('friends', 'followers', 'all'):
+        raise ValueError("Unknown mode: contacts should be one of 'friends', 'followers', 'all'")
+    if metrics is None:
+        metrics = CrawlMetrics()
+    if budget is None:
+        budget = FetchBudget()
+    api = _client(api, cache, metrics, budget)
+    frontier = CrawlFrontier(priority)
+    frontier.push(userID, 0)
+    yield from _crawl(api, frontier, 0, depth, contacts, max_users, budget, metrics, buffer)
+
+def _crawl(api, frontier, expanded, depth, contacts, max_users, budget, metrics, buffer=None, on_batch=None):
+    """
+    crawls the network from the profiles queued in frontier, `expanded` of them having been expanded already,
+    and yields the relationships found as (sources, targets) int64 arrays, pushing the new contacts into frontier.
+    Profiles are popped one per worker, and on_batch(expanded) is called once the edges of a batch of profiles
+    have all been consumed, when the frontier matches the edges yielded so far (fetch_network checkpoints there).
+    With a call budget, the pages of a profile are held back until it is complete: a profile cut by the budget
+    yields nothing and goes back in the frontier, so that a resumed crawl fetches it whole
+    """
+    hold = budget.max_calls is not None
+    unfetched = []
+
+    def contact_batches(item):
+        contact_id, hop = item
+        try:
+            user = _get_user(api, contact_id, metrics)
+        except BudgetExhausted:
+            unfetched.append(contact_id)
+            return
+        if user is None:
+            return
+        if (yield from _contact_batches(api, user, 'all' if hop == 0 else contacts, budget, metrics, hold)):
+            unfetched.append(contact_id)
+
+    workers = getattr(api, 'workers', 1)
+    while (max_users is None or expanded < max_users) and not budget.exhausted:
+        # popping the next batch of profiles, one per worker
+        batch = []
+        while len(batch) < workers and (max_users is None or expanded + len(batch) < max_users):
+            item = frontier.pop()
+            if item is None:
+                break
+            batch.append(item)
+        if not batch:
+            break
+        hops = dict(batch)
+        for user, direction, sources, targets in _stream(api, contact_batches, batch, buffer):
+            metrics.record_contacts(user.screen_name, direction, len(sources))
+            if hops[user.id] + 1 < depth:
+                for contact_id in (targets if direction == 'friends' else sources).tolist():
+                    frontier.push(contact_id, hops[user.id] + 1)
+            yield sources, targets
+        expanded += len(batch) - len(unfetched)
+        frontier.requeue(unfetched) # left for a resumed crawl
+        unfetched.clear()
+        if on_batch is not None:
+            on_batch(expanded)
+
+def stream_to(batches, *consumers):
+    """
+    feeds every (sources, targets) batch yielded by iter_contacts or iter_network to each consumer,
+    i.e. anything with an add_edges(sources, targets) method such as an EdgeSink or a CSRGraphBuilder;
+    returns the consumer, or the tuple of consumers if more than one is given
+    """
+    for sources, targets in batches:
+        for consumer in consumers:
+            consumer.add_edges(sources, targets)
+    return consumers[0] if len(consumers) == 1 else consumers
+
+def fetch_contacts(api, user_list, contacts, sink=None, cache=None, metrics=None, budget=None):
     """
         Obtains friends and followers of users from a given list of users.
 
@@ -11,115 +363,126 @@ def fetch_contacts(api, user_list, contacts):
 
         The contacts are stored in a DataFrame, where each row represents an instance of a relationship
         i.e. the profile in the 'source' col follows the profile in the 'target' col.
-    
-    :param List[twitter.Api] api: a list with one or more Twitter API instances;
+
+    :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
     :param list user_list: a list of userIDs to fetch friends and followers from;
     :param str contacts: the kind of contacts wanted for each user in the list:
         'friends' are profiles followed by the user(s);
         'followers' are profiles following the user(s);
         'all' is the union of friends and followers.
-    :return: a DataFrame with friends, followers or both for each userID. 
+    :param EdgeSink sink: where the edges are accumulated (e.g. chunked to disk); defaults to an in-memory sink;
+    :param ResponseCache cache: answers repeated calls from disk instead of the API, if given;
+    :param CrawlMetrics metrics: records calls, waits, errors and progress; defaults to one logging the progress;
+    :param FetchBudget budget: pages per user, total calls and sampling of large accounts; defaults to
+        FetchBudget(), i.e. the first page of 5000 IDs of every user; users (or the followers of a user)
+        left once its calls are spent are skipped and listed in attrs['sampling'] with method 'budget';
+    :return: a DataFrame with friends, followers or both for each userID, users whose profile can't be fetched
+        are skipped like in iter_contacts; the users whose contacts were cut are listed in its attrs['sampling']
+        (see FetchBudget.report).
     """
-    df = pd.DataFrame(columns=['source','target']) # empty df
-
-    if contacts == 'friends':
-    # fetching friends
-        for userID in user_list:
-            friends = []
-            friends_list = []
-            # fetching the user
-            user = api.get_user(user_id=userID)
-            # fetching the friends_count
-            friends_count = user.friends_count
-            try:
-                for page in tweepy.Cursor(api.get_friend_ids, user_id=userID).pages():
-                    friends.extend(page)
-                    print(user.screen_name, 'follows', len(friends), 'profiles')
-                    if friends_count >= 5000: #Only take first 5000 friends
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            friends_list.append(friends)
-            temp1 = pd.DataFrame(columns=['source', 'target'])
-            temp1['target'] = friends_list[0] # set the list of friends as the target column
-            temp1['source'] = userID # set the user ID as the source 
-            df = df.append(temp1)
-
-    elif contacts == 'followers':
-    # fetching followers
-        for userID in user_list:
-            followers = []
-            follower_list = []
-            # fetching the user
-            user = api.get_user(user_id=userID)
-            # fetching the followers_count
-            followers_count = user.followers_count
-            try:
-                for page in tweepy.Cursor(api.get_follower_ids, user_id=userID).pages():
-                    followers.extend(page)
-                    print(user.screen_name, 'is followed by', len(followers), 'profiles')
-                    if followers_count >= 5000: #Only take first 5000 followers
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            follower_list.append(followers)
-            temp2 = pd.DataFrame(columns=['source', 'target'])
-            temp2['source'] = follower_list[0] # set the list of followers as the source column
-            temp2['target'] = userID # set the user ID as the target (user is followed by followers)
-            df = df.append(temp2)
-            
-    elif contacts == 'all':
-    # fetching friends
-        for userID in user_list:
-            friends = []
-            friends_list = []
-            # fetching the user
-            user = api.get_user(user_id=userID)
-            # fetching the friends_count
-            friends_count = user.friends_count
-            try:
-                for page in tweepy.Cursor(api.get_friend_ids, user_id=userID).pages():
-                    friends.extend(page)
-                    if friends_count >= 5000: #Only take first 5000 friends
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            friends_list.append(friends)
-            temp1 = pd.DataFrame(columns=['source', 'target'])
-            temp1['target'] = friends_list[0] # set the list of friends as the target column
-            temp1['source'] = userID # set the user ID as the source 
-            df = df.append(temp1)
-    # fetching followers
-        for userID in user_list:
-            followers = []
-            follower_list = []
-            # fetching the user
-            user = api.get_user(user_id=userID)
-            # fetching the followers_count
-            followers_count = user.followers_count
-            try:
-                for page in tweepy.Cursor(api.get_follower_ids, user_id=userID).pages():
-                    followers.extend(page)
-                    print(user.screen_name, 'follows', len(friends), 'profiles \n', 
-                        user.screen_name, 'is followed by', len(followers), 'profiles')
-                    if followers_count >= 5000: #Only take first 5000 followers
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            follower_list.append(followers)
-            temp2 = pd.DataFrame(columns=['source', 'target'])
-            temp2['source'] = follower_list[0] # set the list of followers as the source column
-            temp2['target'] = userID # set the user ID as the target (user is followed by followers)
-            df = df.append(temp2)    
-    else: 
+    if sink is None:
+        sink = EdgeSink()
+    if metrics is None:
+        metrics = CrawlMetrics()
+    if budget is None:
+        budget = FetchBudget()
+
+    stream_to(iter_contacts(api, user_list, contacts, cache, metrics, budget=budget), sink)
+    frame = sink.to_frame()
+    frame.attrs['sampling'] = budget.report()
+    return frame
+
+def fetch_contacts_delta(api, user_list, contacts, snapshot_dir, metrics=None, budget=None):
+    """
+        Incremental version of fetch_contacts: instead of every relationship of the users in the list,
+        returns only the relationships added or removed since the previous call with the same snapshot_dir.
+
+        For each user the friends_count / followers_count and the first page of IDs are compared
+        with the stored snapshot: if both are unchanged the user is skipped after a single call,
+        otherwise the full list is fetched, diffed against the snapshot and the snapshot is replaced.
+        Users seen for the first time have all their relationships reported as added.
+        Only the first budget.max_pages pages of every user are tracked, like in fetch_contacts: for users
+        whose list is longer than that only the contacts ahead of the most recent known one are reported as added,
+        and none as removed, since a contact leaving the window may just have been pushed out of it by newer ones;
+        these users are listed in the attrs['sampling'] of the output (see FetchBudget.report).
+        Don't put a ResponseCache in front of api here, a cached first page would hide every change.
+
+    :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
+    :param list user_list: a list of userIDs to refresh;
+    :param str contacts: 'friends', 'followers' or 'all', as in fetch_contacts;
+    :param str snapshot_dir: directory of the FollowSnapshotStore holding the last state of each user;
+    :param CrawlMetrics metrics: records calls, waits, errors and progress; defaults to one logging the progress;
+    :param FetchBudget budget: pages per user and total calls, defaults to FetchBudget(); sampling is not
+        supported, the diff of two random samples would be mostly noise;
+    :return: a DataFrame with 'source', 'target' and 'change' cols, where 'change' is either 'added' or 'removed';
+        the users whose lists were cut are listed in its attrs['sampling'].
+    """
+    if contacts not in ('friends', 'followers', 'all'):
         raise ValueError("Unknown mode: contacts should be one of 'friends', 'followers', 'all'")
-    return df 
-    
-def fetch_contacts_named(api, user_list, contacts):
+    if metrics is None:
+        metrics = CrawlMetrics()
+    if budget is None:
+        budget = FetchBudget()
+    if budget.sample_size is not None:
+        raise ValueError("fetch_contacts_delta can't diff sampled contacts, budget.sample_size must be None")
+    api = _client(api, metrics=metrics, budget=budget)
+    store = FollowSnapshotStore(snapshot_dir)
+    directions = [d for d in ('friends', 'followers') if contacts in (d, 'all')]
+    methods = {'friends': api.get_friend_ids, 'followers': api.get_follower_ids}
+
+    def refresh(user, direction):
+        """ returns (count, first page, every ID, cut) if the user changed, None if unchanged or on errors """
+        count = getattr(user, direction + '_count')
+        snapshot = store.load(user.id, direction)
+        first_page, next_cursor = _fetch_first_page(methods[direction], metrics, user_id=user.id)
+        if first_page is None:
+            return None
+        if snapshot is not None and snapshot['count'] == count and np.array_equal(snapshot['first_page'], first_page):
+            return None
+        ids = list(first_page)
+        if next_cursor != 0 and budget.max_pages == 1:
+            budget.record(user.id, direction, count, len(ids), 'first_pages')
+            return count, first_page, ids, True
+        if next_cursor != 0:
+            max_pages = None if budget.max_pages is None else budget.max_pages - 1
+            rest = _fetch_pages(methods[direction], count, budget, metrics, max_pages, len(ids), user_id=user.id,
+                                cursor=next_cursor)
+            if rest is None:
+                return None
+            ids.extend(rest)
+        return count, first_page, ids, budget.was_cut(user.id, direction)
+
+    def fetch_user(user):
+        return [refresh(user, direction) for direction in directions]
+
+    # fresh counts for every user, 100 per call
+    users = [user for user in UserHydrator(api).hydrate(user_list) if user is not None]
+    sources, targets, changes = [], [], []
+    for user, results in zip(users, map_users(api, fetch_user, users)):
+        for direction, result in zip(directions, results):
+            if result is None:
+                continue
+            count, first_page, ids, cut = result
+            snapshot = store.load(user.id, direction)
+            added, removed = (diff_window if cut else diff_ids)(None if snapshot is None else snapshot['ids'], ids)
+            metrics.record_contacts(user.screen_name, direction, len(added) + len(removed),
+                                    added=len(added), removed=len(removed))
+            for changed, change in ((added, 'added'), (removed, 'removed')):
+                seed = np.full(len(changed), user.id, dtype=np.int64)
+                if direction == 'friends': # the user follows its friends
+                    sources.append(seed)
+                    targets.append(changed)
+                else: # the user is followed by its followers
+                    sources.append(changed)
+                    targets.append(seed)
+                changes.append(np.full(len(changed), change, dtype=object))
+            store.save(user.id, direction, count, first_page, ids)
+    frame = delta_frame(sources, targets, changes)
+    frame.attrs['sampling'] = budget.report()
+    return frame
+
+def fetch_contacts_named(api, user_list, contacts, sink=None, cache=None, hydrator=None, metrics=None,
+                         budget=None):
     """
         Obtains friends and followers of users from a given list of users.
 
@@ -129,246 +492,191 @@ def fetch_contacts_named(api, user_list, contacts):
 
         The contacts are stored in a DataFrame, where each row represents an instance of a relationship
         i.e. the profile in the 'source' col follows the profile in the 'target' col.
-    
-    :param List[twitter.Api] api: a list with one or more Twitter API instances;
+        Contacts are fetched as pages of 5000 IDs and then resolved to screen names 100 at a time
+        by a UserHydrator, which hydrates every account only once across all the users in the list.
+
+    :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
     :param list user_list: a list of screen names of users to fetch friends and followers from;
     :param str contacts: the kind of contacts wanted for each user in the list:
         'friends' are profiles followed by the user(s);
         'followers' are profiles following the user(s);
         'all' is the union of friends and followers.
-    :return: a DataFrame with friends, followers or both for each screen name in the user_list. 
+    :param EdgeSink sink: where the edges are accumulated, with dtype='object'; defaults to an in-memory sink;
+    :param ResponseCache cache: answers repeated calls from disk instead of the API, if given;
+    :param UserHydrator hydrator: ID -> profile map to reuse across calls; a new one is created if None;
+    :param CrawlMetrics metrics: records calls, waits, errors and progress; defaults to one logging the progress;
+    :param FetchBudget budget: pages per user, total calls and sampling of large accounts; defaults to
+        FetchBudget(), i.e. the first page of 5000 IDs of every user; contacts that can't be fetched or resolved
+        once its calls are spent are left out, the users missing some are listed in attrs['sampling'];
+    :return: a DataFrame with friends, followers or both for each screen name in the user_list;
+        the users whose contacts were cut are listed in its attrs['sampling'] (see FetchBudget.report).
     """
-    df = pd.DataFrame(columns=['source','target']) # empty df
-
-    if contacts == 'friends':
-    # fetching friends
-        for u in user_list:
-            friends = []
-            friends_list = []
-            # fetching the user
-            user = api.get_user(screen_name=u)
-            # fetching the friends_count
-            friends_count = user.friends_count
-            try:
-                for page in tweepy.Cursor(api.get_friends, screen_name=u).pages():
-                    friends.extend(page)
-                    if friends_count >= 5000: #Only take first 5000 friends
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            print(user.screen_name, 'follows', len(friends), 'profiles')
-            # appending names to friend list
-            for friend in friends:
-                friends_list.append(friend.screen_name)
-            temp1 = pd.DataFrame(columns=['source', 'target'])
-            temp1['target'] = friends_list # set the list of friends as the target column
-            temp1['source'] = u # set the user ID as the source 
-            df = df.append(temp1)
-
-    elif contacts == 'followers':
-    # fetching followers
-        for u in user_list:
-            followers = []
-            follower_list = []
-            # fetching the user
-            user = api.get_user(screen_name=u)
-            # fetching the followers_count
-            followers_count = user.followers_count
-            try:
-                for page in tweepy.Cursor(api.get_followers, screen_name=u).pages():
-                    followers.extend(page)
-                    if followers_count >= 5000: #Only take first 5000 followers
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            print(user.screen_name, 'is followed by', len(followers), 'profiles')
-            # appending names to followers list
-            for follower in followers:
-                follower_list.append(follower.screen_name)
-            temp2 = pd.DataFrame(columns=['source', 'target'])
-            temp2['source'] = follower_list # set the list of followers as the source column
-            temp2['target'] = u # set the user ID as the target (user is followed by followers)
-            df = df.append(temp2)
-            
-    elif contacts == 'all':
-    # fetching friends
-        for u in user_list:
-            friends = []
-            friends_list = []
-            # fetching the user
-            user = api.get_user(screen_name=u)
-            # fetching the friends_count
-            friends_count = user.friends_count
-            try:
-                for page in tweepy.Cursor(api.get_friends, screen_name=u).pages():
-                    friends.extend(page)
-                    if friends_count >= 5000: #Only take first 5000 friends
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            # appending names to friend list
-            for friend in friends:
-                friends_list.append(friend.screen_name)
-            temp1 = pd.DataFrame(columns=['source', 'target'])
-            temp1['target'] = friends_list # set the list of friends as the target column
-            temp1['source'] = u # set the user ID as the source 
-            df = df.append(temp1)
-    # fetching followers
-        for u in user_list:
-            followers = []
-            follower_list = []
-            # fetching the user
-            user = api.get_user(screen_name=u)
-            # fetching the followers_count
-            followers_count = user.followers_count
-            try:
-                for page in tweepy.Cursor(api.get_followers,screen_name=u).pages():
-                    followers.extend(page)
-                    if followers_count >= 5000: #Only take first 5000 followers
-                        break
-            except tweepy.TweepyException:
-                print("error")
-                continue
-            print(user.screen_name, 'follows', len(friends), 'profiles \n', 
-                user.screen_name, 'is followed by', len(followers), 'profiles')
-            for follower in followers:
-                follower_list.append(follower.screen_name)
-            temp2 = pd.DataFrame(columns=['source', 'target'])
-            temp2['source'] = follower_list # set the list of followers as the source column
-            temp2['target'] = u # set the user ID as the target (user is followed by followers)
-            df = df.append(temp2)    
-    else: 
+    if contacts not in ('friends', 'followers', 'all'):
         raise ValueError("Unknown mode: contacts should be one of 'friends', 'followers', 'all'")
-    return df 
+    if sink is None:
+        sink = EdgeSink(dtype='object')
+    if metrics is None:
+        metrics = CrawlMetrics()
+    if budget is None:
+        budget = FetchBudget()
+
+    api = _client(api, cache, metrics, budget)
+    if hydrator is None:
+        hydrator = UserHydrator(api)
+
+    directions = [d for d in ('friends', 'followers') if contacts in (d, 'all')]
+
+    def fetch_user(user):
+        fetched = {}
+        for direction, method in (('friends', api.get_friend_ids), ('followers', api.get_follower_ids)):
+            if direction in directions:
+                fetched[direction] = _fetch_pages(method, getattr(user, direction + '_count'), budget, metrics,
+                                                  user_id=user.id)
+        _record_unfetched(budget, user.id, user, fetched)
+        return fetched.get('friends'), fetched.get('followers')
+
+    # fetching the users, then the IDs of their contacts
+    seeds = [(u, user) for u, user in zip(user_list, hydrator.lookup_names(user_list)) if user is not None]
+    results = list(map_users(api, fetch_user, [user for _, user in seeds]))
+    # resolving every contact to its screen name at once
+    try:
+        hydrator.hydrate([i for pair in results for ids in pair if ids for i in ids])
+    except BudgetExhausted:
+        pass # the calls ran out, contacts not hydrated yet are left out
+
+    def screen_names(ids):
+        return [hydrator.profiles[i].screen_name for i in ids if hydrator.profiles.get(i) is not None]
+
+    for (u, user), (friends, followers) in zip(seeds, results):
+        if friends is not None:
+            metrics.record_contacts(user.screen_name, 'friends', len(friends))
+            sink.add_targets(u, screen_names(friends))
+        if followers is not None:
+            metrics.record_contacts(user.screen_name, 'followers', len(followers))
+            sink.add_sources(screen_names(followers), u)
+    frame = sink.to_frame()
+    frame.attrs['sampling'] = budget.report()
+    return frame
 
-def fetch_network(api, userID):
+def fetch_network(api, userID, depth=2, contacts='friends', priority='proximity', max_users=None,
+                  checkpoint_dir=None, checkpoint_every=500, sink=None, cache=None, metrics=None, budget=None):
     """
-        Fetches the network of relationships of a given userID: 
-        its friends, followers and their relationships between each other 
+        Fetches the network of relationships of a given userID:
+        its friends, followers and their relationships between each other
+
+        The network is crawled outwards from userID: friends and followers of the seed are fetched first,
+        then the contacts of every profile less than `depth` hops away from it, each profile only once.
+        With the default depth=2 this gives the friends of the seed's friends and followers.
+        If checkpoint_dir is given, the frontier, the visited profiles and the edges are saved there
+        every checkpoint_every profiles, together with the users whose contacts were cut so far;
+        calling fetch_network again with the same checkpoint_dir and priority resumes an interrupted crawl
+        from the last checkpoint. The crawl itself is the one of iter_network, whose edges are written to the sink.
+
+    :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
+    :param int userID: the ID of the user whose network is fetched;
+    :param int depth: profiles up to depth - 1 hops away from the seed get their contacts fetched;
+    :param str contacts: the kind of contacts fetched for profiles other than the seed ('friends', 'followers', 'all');
+    :param str priority: order of the crawl, 'proximity' (breadth first) or 'degree' (most linked profiles first);
+    :param int max_users: maximum number of profiles whose contacts are fetched, no limit if None;
+    :param str checkpoint_dir: directory where the crawl is checkpointed and resumed from;
+    :param int checkpoint_every: number of profiles fetched between two checkpoints;
+    :param EdgeSink sink: where the edges are accumulated (e.g. chunked to disk); defaults to an in-memory sink,
+        or to a sink inside checkpoint_dir when checkpointing;
+    :param ResponseCache cache: answers repeated calls from disk instead of the API, if given;
+    :param CrawlMetrics metrics: records calls, waits, errors and progress; defaults to one logging the progress;
+    :param FetchBudget budget: pages per user, total calls and sampling of large accounts; defaults to
+        FetchBudget(), i.e. the first page of 5000 IDs of every user;
+        the crawl stops when its calls are spent, and a checkpointed crawl can be resumed with a new budget;
+    :return: a DataFrame where the profile in the 'source' col follows the profile in the 'target' col;
+        the users whose contacts were cut are listed in its attrs['sampling'] (see FetchBudget.report).
     """
-    df = pd.DataFrame(columns=['source','target']) # empty df
-    
-    # fetching friends
-    friends = []
-    friends_list = []
-    # fetching the user
-    user = api.get_user(user_id=userID)
-    friends_count = user.friends_count
-    try:
-        for page in tweepy.Cursor(api.get_friend_ids, user_id=userID).pages():
-            friends.extend(page)
-            print(user.screen_name, 'follows', len(friends), 'profiles')
-            if friends_count >= 5000: #Only take first 5000 friends
-                break
-    except tweepy.TweepyException:
-        print("error")
-    friends_list.append(friends)
-    temp1 = pd.DataFrame(columns=['source', 'target'])
-    temp1['target'] = friends_list[0] # set the list of friends as the target column
-    temp1['source'] = userID # set the user ID as the source 
-    df = df.append(temp1)
-
-    # fetching followers
-    followers = []
-    follower_list = []
-    followers_count = user.followers_count 
-    try:
-        for page in tweepy.Cursor(api.get_follower_ids, user_id=userID).pages():
-            followers.extend(page)
-            print(user.screen_name, 'is followed by', len(followers), 'profiles')
-            if followers_count >= 5000: #Only take first 5000 followers
-                break
-    except tweepy.TweepyException:
-        print("error")
-    follower_list.append(followers)
-    temp2 = pd.DataFrame(columns=['source', 'target'])
-    temp2['source'] = follower_list[0] # set the list of followers as the source column
-    temp2['target'] = userID # set the user ID as the target (user is followed by followers)
-    df = df.append(temp2) 
-    
-    # friends of friends
-    for friend_id in temp1['target']:
-        friends_of_friends = []
-        friends_of_friends_list = []
-        # fetching the user
-        try:
-            user = api.get_user(user_id=friend_id)
-        except tweepy.TweepyException:
-            continue    
-        # fetching the friends_count and followers_count
-        friends_of_friends_count = user.friends_count
-        try:
-            for page in tweepy.Cursor(api.get_friend_ids, user_id=friend_id).pages():
-                friends_of_friends.extend(page)
-                print(user.screen_name, 'follows', len(friends_of_friends), 'profiles')
-                if friends_of_friends_count >= 5000: #Only take first 5000 friends
-                    break
-        except tweepy.TweepyException:
-            print("error")
-            continue
-        friends_of_friends_list.append(friends_of_friends)
-        temp3 = pd.DataFrame(columns=['source', 'target'])
-        temp3['target'] = friends_of_friends_list[0] # set the list of friends as the target column
-        temp3['source'] = friend_id # set the user ID as the source 
-        df = df.append(temp3)
-    
-    # friends of followers
-    for follower_id in temp2['source']:
-        friends_of_followers = []
-        friends_of_followers_list = []
-        # fetching the user
-        try:
-            user = api.get_user(user_id=follower_id)
-        except tweepy.TweepyException:
-            continue    
-        # fetching the friends_count and followers_count
-        friends_of_followers_count = user.followers_count
-        try:
-            for page in tweepy.Cursor(api.get_friend_ids, user_id=follower_id).pages():
-                friends_of_followers.extend(page)
-                print(user.screen_name, 'follows', len(friends_of_followers), 'profiles')
-                if friends_of_followers_count >= 5000: #Only take first 5000 friends
-                    break
-        except tweepy.TweepyException:
-            print("error")
-            continue
-        friends_of_followers_list.append(friends_of_followers)
-        temp4 = pd.DataFrame(columns=['source', 'target'])
-        temp4['target'] = friends_of_followers_list[0] # set the list of friends as the target column
-        temp4['source'] = follower_id # set the user ID as the source 
-        df = df.append(temp4)
-    return df
-
-def twitter_monitor(api, user_list):
+    if contacts not in ('friends', 'followers', 'all'):
+        raise ValueError("Unknown mode: contacts should be one of 'friends', 'followers', 'all'")
+    if metrics is None:
+        metrics = CrawlMetrics()
+    if budget is None:
+        budget = FetchBudget()
+    api = _client(api, cache, metrics, budget)
+
+    state_path = None
+    if checkpoint_dir is not None:
+        if sink is not None:
+            raise ValueError("A checkpointed crawl writes its edges inside checkpoint_dir, sink must be None")
+        state_path = os.path.join(checkpoint_dir, 'frontier.pkl')
+        sink = EdgeSink(os.path.join(checkpoint_dir, 'edges'))
+    elif sink is None:
+        sink = EdgeSink()
+
+    if state_path is not None and os.path.exists(state_path):
+        frontier, state = CrawlFrontier.load(state_path)
+        if state['seed'] != userID:
+            raise ValueError(f"{checkpoint_dir} holds the crawl of user {state['seed']}, not {userID}")
+        if frontier.priority != priority:
+            raise ValueError(f"{checkpoint_dir} holds a crawl with priority '{frontier.priority}', not '{priority}'")
+        budget.merge(state['records']) # users cut before the checkpoint
+        sink.truncate(state['partitions']) # drop edges written after the last checkpoint
+        expanded = state['expanded']
+    else:
+        if state_path is not None:
+            sink.truncate(0)
+        frontier = CrawlFrontier(priority)
+        frontier.push(userID, 0)
+        expanded = 0
+
+    def checkpoint():
+        sink.flush()
+        # users put back in the frontier are fetched again on resume, only the cuts of expanded ones are kept
+        records = [record for record in budget.records if record['user'] in frontier.visited]
+        frontier.save(state_path, seed=userID, partitions=len(sink.partitions), expanded=expanded, records=records)
+
+    checkpointed = expanded
+
+    def on_batch(now_expanded):
+        nonlocal expanded, checkpointed
+        expanded = now_expanded
+        if state_path is not None and expanded - checkpointed >= checkpoint_every:
+            checkpoint()
+            checkpointed = expanded
+
+    stream_to(_crawl(api, frontier, expanded, depth, contacts, max_users, budget, metrics, on_batch=on_batch), sink)
+    if state_path is not None:
+        checkpoint()
+    frame = sink.to_frame()
+    frame.attrs['sampling'] = budget.report()
+    return frame
+
+def twitter_monitor(api, user_list, cache=None, hydrator=None, metrics=None, store=None):
   """
     Fetches a list of features from each account in user_list and saves them into a DataFrame
 
-  :param List[twitter.Api] api: a list with one or more Twitter API instances;
+    Counts are int64, created_at a UTC timestamp and average_tweets the float32 number of tweets per day
+    (see MONITOR_SCHEMA); with a MonitorStore the frame is also appended to it as a new dated snapshot.
+
+  :param List[twitter.Api] api: a list with one or more Twitter API instances, or a CredentialPool over them;
   :param list user_list: a list of screen names of users to fetch features from;
+  :param ResponseCache cache: answers repeated calls from disk instead of the API, if given;
+  :param UserHydrator hydrator: ID -> profile map to reuse across calls; a new one is created if None;
+  :param CrawlMetrics metrics: records the calls made, if given;
+  :param MonitorStore store: where the snapshot is appended, if given;
   :returns: a DataFrame where each row represents a user and each column a feature.
   """
-  df = pd.DataFrame(columns=['screen_name','description', 'statuses_count', 'friends_count', 'followers_count',
-                            'account_age_days', 'average_tweets'])
-  for account in user_list:
-    temp = pd.DataFrame(columns=['screen_name','description', 'statuses_count', 'friends_count', 'followers_count', 
-                                'account_age_days', 'average_tweets'])
-    user = api.get_user(screen_name=account)
-    temp['screen_name'] = str(user.screen_name)
-    temp['description'] = str(user.description)
-    temp['statuses_count'] = str(user.statuses_count)
-    temp['friends_count'] = str(user.friends_count)
-    temp['followers_count'] = str(user.followers_count)
-    tweets = str(user.statuses_count)
-    account_created_date = user.created_at
-    delta = datetime.utcnow() - account_created_date
-    account_age_days = delta.days
-    temp['average_tweets'] = 0
-    if account_age_days > 0:
-      average_tweets = str(round(int(tweets)/int(account_age_days),2))
-    temp['account_age_days'] = str(account_age_days)
-
-    df = df.append(temp)
-  return df
+  api = _client(api, cache, metrics)
+  if hydrator is None:
+    hydrator = UserHydrator(api)
+  now = datetime.now(timezone.utc)
+  rows = []
+  # profiles are looked up 100 at a time, accounts that no longer exist are skipped
+  for user in filter(None, hydrator.lookup_names(user_list)):
+    rows.append({'user_id': user.id,
+                 'screen_name': user.screen_name,
+                 'description': user.description,
+                 'statuses_count': user.statuses_count,
+                 'friends_count': user.friends_count,
+                 'followers_count': user.followers_count,
+                 'created_at': user.created_at})
+  columns = ['user_id', 'screen_name', 'description', 'statuses_count', 'friends_count', 'followers_count',
+             'created_at']
+  frame = typed_snapshot(pd.DataFrame(rows, columns=columns), now)
+  if store is not None:
+    store.append(frame, now)
+  return frame
@@ -0,0 +1,194 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import networkx as nx
+import scipy.sparse as sp
+
+
+class CSRGraph:
+  """
+    Compact graph storage: node names are interned to int32 IDs (sorted by name) and the adjacency
+    is kept as two numpy arrays in CSR form, the neighbours of node i being indices[indptr[i]:indptr[i+1]].
+
+    Graphs are saved as a directory of .npy files whose adjacency arrays (and integer names) `load`
+    memory-maps, so the edges of even a multi-million-edge crawl are only read from the pages actually used;
+    screen names are the exception, they are decoded into python strings when loading, in one pass
+    over the names (a fraction of a second per million).
+    Undirected graphs store every edge in both directions.
+
+  :param np.ndarray names: name of each node (user IDs or screen names), sorted;
+  :param np.ndarray indptr: int64 array of length n_nodes + 1 with the offsets of each node's neighbours;
+  :param np.ndarray indices: int32 array with the neighbours of every node, one after the other;
+  :param bool directed: whether (u, v) means u -> v only.
+  """
+  def __init__(self, names, indptr, indices, directed=True):
+    self.names = names
+    self.indptr = indptr
+    self.indices = indices
+    self.directed = directed
+
+  @property
+  def n_nodes(self):
+    return len(self.indptr) - 1
+
+  @property
+  def n_edges(self):
+    """ number of stored (directed) adjacency entries """
+    return len(self.indices)
+
+  def degree(self):
+    """ out-degree of every node """
+    return np.diff(self.indptr)
+
+  def neighbors(self, i):
+    """ internal IDs of the neighbours of internal node i """
+    return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+  def node_ids(self, names):
+    """ maps node names to internal IDs, raising KeyError for unknown names """
+    names = np.asarray(names, dtype=self.names.dtype)
+    ids = np.searchsorted(self.names, names)
+    found = ids < len(self.names)
+    found[found] = self.names[ids[found]] == names[found]
+    if not found.all():
+      raise KeyError(f"Unknown nodes: {names[~found][:5].tolist()}")
+    return ids.astype(np.int32)
+
+  def adjacency(self, dtype=np.float64):
+    """ returns the adjacency as a scipy CSR matrix sharing the index arrays """
+    data = np.ones(self.n_edges, dtype=dtype)
+    return sp.csr_matrix((data, self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+  @classmethod
+  def from_edgelist(cls, edges, source='source', target='target', directed=True):
+    """
+    builds the graph from a DataFrame of edges (e.g. the output of the scraping functions) or from an EdgeSink;
+    duplicated edges are stored once
+    """
+    if hasattr(edges, 'to_frame'):
+      edges = edges.to_frame()
+    m = len(edges)
+    codes, names = pd.factorize(pd.concat([edges[source], edges[target]], ignore_index=True), sort=True)
+    n = len(names)
+    src, tgt = codes[:m].astype(np.int64), codes[m:].astype(np.int64)
+    if not directed:
+      src, tgt = np.concatenate([src, tgt]), np.concatenate([tgt, src])
+    keys = np.unique(src * n + tgt)  # sorts by source, then target, and drops duplicates
+    src, tgt = keys // n, keys % n
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return cls(np.asarray(names), indptr, tgt.astype(np.int32), directed)
+
+  @classmethod
+  def from_networkx(cls, G):
+    """ builds the graph from a networkx Graph or DiGraph """
+    edges = pd.DataFrame(list(G.edges()), columns=['source', 'target'])
+    graph = cls.from_edgelist(edges, directed=G.is_directed())
+    isolated = [node for node in G.nodes() if G.degree(node) == 0]
+    if isolated:  # nodes without edges are not part of the edge list
+      names = np.sort(np.concatenate([graph.names, np.asarray(isolated, dtype=graph.names.dtype)]))
+      old_ids = np.searchsorted(names, graph.names)
+      indptr = np.zeros(len(names) + 1, dtype=np.int64)
+      indptr[old_ids + 1] = graph.degree()
+      graph = cls(names, np.cumsum(indptr), old_ids[graph.indices].astype(np.int32), graph.directed)
+    return graph
+
+  def to_edgelist(self):
+    """ returns the edges as a DataFrame with 'source' and 'target' cols holding node names """
+    src = np.repeat(np.arange(self.n_nodes), self.degree())
+    return pd.DataFrame({'source': self.names[src], 'target': self.names[self.indices]})
+
+  def to_networkx(self):
+    """ returns the graph as a networkx DiGraph (or Graph if undirected) """
+    G = nx.DiGraph() if self.directed else nx.Graph()
+    G.add_nodes_from(self.names.tolist())
+    edges = self.to_edgelist()
+    G.add_edges_from(zip(edges['source'].tolist(), edges['target'].tolist()))
+    return G
+
+  def save(self, path):
+    """ writes the graph to a directory of .npy files that `load` can memory-map """
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'indptr.npy'), self.indptr)
+    np.save(os.path.join(path, 'indices.npy'), np.asarray(self.indices, dtype=np.int32))
+    if self.names.dtype == object or self.names.dtype.kind == 'U':
+      # strings are stored as a single utf-8 blob plus offsets, so they can be memory-mapped too
+      encoded = [str(name).encode('utf-8') for name in self.names]
+      offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+      np.cumsum([len(e) for e in encoded], out=offsets[1:])
+      np.save(os.path.join(path, 'names_blob.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+      np.save(os.path.join(path, 'names_offsets.npy'), offsets)
+      names = 'str'
+    else:
+      np.save(os.path.join(path, 'names.npy'), self.names.astype(np.int64))
+      names = 'int64'
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+      json.dump({'directed': self.directed, 'names': names,
+                 'n_nodes': self.n_nodes, 'n_edges': self.n_edges}, f)
+
+  @classmethod
+  def load(cls, path, mmap=True):
+    """ opens a graph written by `save`, memory-mapping its arrays unless mmap is False (string names are always read) """
+    mode = 'r' if mmap else None
+    with open(os.path.join(path, 'meta.json')) as f:
+      meta = json.load(f)
+    indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode=mode)
+    indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode=mode)
+    if meta['names'] == 'str':
+      blob = np.load(os.path.join(path, 'names_blob.npy'), mmap_mode=mode).tobytes()
+      offsets = np.load(os.path.join(path, 'names_offsets.npy')).tolist()
+      text = blob.decode('utf-8')
+      if len(text) == len(blob): # single-byte characters only: byte offsets are character offsets too
+        names = [text[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+      else:
+        names = [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+      names = np.array(names, dtype=object)
+    else:
+      names = np.load(os.path.join(path, 'names.npy'), mmap_mode=mode)
+    return cls(names, indptr, indices, meta['directed'])
+
+
+class CSRGraphBuilder:
+  """
+    Builds a CSRGraph incrementally from batches of edges, e.g. the ones streamed by iter_contacts
+    or iter_network while a crawl is still running. Batches are buffered and deduplicated every
+    compact_every edges, so memory grows with the number of distinct edges rather than with the pages fetched;
+    `build` can be called at any time to analyse the part of the network collected so far.
+
+  :param bool directed: whether the graph built is directed;
+  :param int compact_every: number of buffered edges that triggers a deduplication.
+  """
+  def __init__(self, directed=True, compact_every=1_000_000):
+    self.directed = directed
+    self.compact_every = compact_every
+    self._edges = None  # deduplicated edges collected so far
+    self._pending = []
+    self._n_pending = 0
+
+  def __len__(self):
+    """ number of distinct edges, once the pending batches are compacted """
+    self._compact()
+    return 0 if self._edges is None else len(self._edges)
+
+  def add_edges(self, sources, targets):
+    """ adds the edges sources[i] -> targets[i] """
+    self._pending.append(pd.DataFrame({'source': sources, 'target': targets}))
+    self._n_pending += len(self._pending[-1])
+    if self._n_pending >= self.compact_every:
+      self._compact()
+
+  def _compact(self):
+    if not self._pending:
+      return
+    frames = self._pending if self._edges is None else [self._edges] + self._pending
+    self._edges = pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+    self._pending, self._n_pending = [], 0
+
+  def build(self):
+    """ returns a CSRGraph of the edges added so far """
+    self._compact()
+    if self._edges is None:
+      return CSRGraph(np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32),
+                      self.directed)
+    return CSRGraph.from_edgelist(self._edges, directed=self.directed)
@@ -0,0 +1,143 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+# column types of a twitter_monitor snapshot
+MONITOR_SCHEMA = {
+    'user_id': 'int64',
+    'screen_name': 'string',
+    'description': 'string',
+    'statuses_count': 'int64',
+    'friends_count': 'int64',
+    'followers_count': 'int64',
+    'created_at': 'datetime64[ns, UTC]',
+    'account_age_days': 'int64',
+    'average_tweets': 'float32',
+}
+
+
+def typed_snapshot(frame, now=None):
+    """
+    casts the columns of a twitter_monitor frame to MONITOR_SCHEMA, computing account_age_days and
+    average_tweets (tweets per day, NaN for accounts younger than a day) from created_at and now (UTC)
+    """
+    frame = frame.copy()
+    frame['created_at'] = pd.to_datetime(frame['created_at'], utc=True)
+    now = pd.Timestamp.now(tz='UTC') if now is None else pd.Timestamp(now).tz_convert('UTC')
+    frame['account_age_days'] = (now - frame['created_at']).dt.days
+    age = frame['account_age_days'].where(frame['account_age_days'] > 0)
+    frame['average_tweets'] = (frame['statuses_count'] / age).round(2)
+    return frame[list(MONITOR_SCHEMA)].astype(MONITOR_SCHEMA)
+
+
+def derived_metrics(frame):
+    """
+    adds per-snapshot metrics to a frame loaded from a MonitorStore: follower / friend ratio, and for
+    every account the change of followers, friends and statuses since its previous snapshot and per day
+    """
+    frame = frame.sort_values(['user_id', 'snapshot_at'], ignore_index=True)
+    frame['follower_friend_ratio'] = (frame['followers_count'] / frame['friends_count'].where(
+        frame['friends_count'] > 0)).astype('float32')
+    by_user = frame.groupby('user_id', sort=False)
+    days = by_user['snapshot_at'].diff().dt.total_seconds() / 86400
+    for metric in ('followers', 'friends', 'statuses'):
+        change = by_user[metric + '_count'].diff()
+        frame[metric + '_change'] = change.astype('Int64')
+        frame[metric + '_per_day'] = (change / days.where(days > 0)).astype('float32')
+    return frame
+
+
+class MonitorStore:
+    """
+        Date-partitioned Parquet store of the account snapshots taken by twitter_monitor.
+
+        Every run is appended as a new file path/date=YYYY-MM-DD/part-HHMMSSffffff.parquet with typed
+        columns (see MONITOR_SCHEMA) plus a 'snapshot_at' UTC timestamp, so tracking thousands of accounts
+        daily never rewrites older runs, and range queries only open the partitions of the dates they cover.
+
+    :param str path: directory of the store.
+    """
+    def __init__(self, path='monitor_store'):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, frame, snapshot_at=None):
+        """ writes a twitter_monitor frame as the snapshot taken at snapshot_at (now by default), returns its file """
+        snapshot_at = pd.Timestamp.now(tz='UTC') if snapshot_at is None else pd.Timestamp(snapshot_at)
+        snapshot_at = snapshot_at.tz_localize('UTC') if snapshot_at.tzinfo is None else snapshot_at.tz_convert('UTC')
+        frame = frame[list(MONITOR_SCHEMA)].astype(MONITOR_SCHEMA)
+        frame.insert(0, 'snapshot_at', pd.Series(snapshot_at, index=frame.index, dtype='datetime64[ns, UTC]'))
+        directory = os.path.join(self.path, f'date={snapshot_at:%Y-%m-%d}')
+        os.makedirs(directory, exist_ok=True)
+        file = os.path.join(directory, f'part-{snapshot_at:%H%M%S%f}.parquet')
+        frame.to_parquet(file + '.tmp', index=False)
+        os.replace(file + '.tmp', file)
+        return file
+
+    def dates(self):
+        """ dates with at least one snapshot, in order """
+        return sorted(pd.Timestamp(os.path.basename(d)[len('date='):]).date()
+                      for d in glob.glob(os.path.join(self.path, 'date=*')))
+
+    def load(self, start=None, end=None, users=None, columns=None):
+        """
+        returns the snapshots taken between start and end (UTC timestamps or dates, both included),
+        optionally only the ones of the given user IDs or screen names and only some columns
+        """
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        start = start.tz_localize('UTC') if start is not None and start.tzinfo is None else start
+        end = end.tz_localize('UTC') if end is not None and end.tzinfo is None else end
+        if end is not None and end == end.normalize():
+            end = end + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')  # a date covers the whole day
+        files = [file for date in self.dates()
+                 if (start is None or date >= start.date()) and (end is None or date <= end.date())
+                 for file in sorted(glob.glob(os.path.join(self.path, f'date={date}', 'part-*.parquet')))]
+        filters = None
+        if users is not None:
+            users = list(users)
+            key = 'screen_name' if users and isinstance(users[0], str) else 'user_id'
+            filters = [(key, 'in', users)]
+        if columns is not None:
+            columns = list(dict.fromkeys(['snapshot_at', *columns]))
+        frames = [pd.read_parquet(file, columns=columns, filters=filters) for file in files]
+        if not frames:
+            schema = {'snapshot_at': 'datetime64[ns, UTC]', **MONITOR_SCHEMA}
+            return pd.DataFrame({c: pd.Series(dtype=t) for c, t in schema.items() if columns is None or c in columns})
+        frame = pd.concat(frames, ignore_index=True)
+        keep = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            keep &= (frame['snapshot_at'] >= start).to_numpy()
+        if end is not None:
+            keep &= (frame['snapshot_at'] <= end).to_numpy()
+        return frame[keep].reset_index(drop=True)
+
+    def latest(self, users=None):
+        """ returns the most recent snapshot of every account """
+        frame = self.load(users=users)
+        return frame.sort_values('snapshot_at').groupby('user_id').tail(1).reset_index(drop=True)
+
+    def growth(self, users=None, days=90, metric='followers_count', end=None):
+        """
+        returns, for every account, the value of metric at its first and last snapshot of the `days` days
+        before end (now by default), the absolute and relative change and the change per day
+        """
+        end = pd.Timestamp.now(tz='UTC') if end is None else pd.Timestamp(end)
+        end = end.tz_localize('UTC') if end.tzinfo is None else end
+        frame = self.load(end - pd.Timedelta(days=days), end, users, columns=['user_id', 'screen_name', metric])
+        by_user = frame.sort_values('snapshot_at').groupby('user_id')
+        first, last = by_user.first(), by_user.last()
+        change = last[metric] - first[metric]
+        span = (last['snapshot_at'] - first['snapshot_at']).dt.total_seconds() / 86400
+        return pd.DataFrame({'screen_name': last['screen_name'],
+                             'first': first[metric], 'last': last[metric], 'change': change,
+                             'relative_change': (change / first[metric].where(first[metric] > 0)).astype('float32'),
+                             'per_day': (change / span.where(span > 0)).astype('float32')}).reset_index()
+
+    def timeseries(self, users=None, metric='followers_count', start=None, end=None):
+        """ returns metric as a (day x user ID) DataFrame, with the last value of each day """
+        frame = self.load(start, end, users, columns=['user_id', metric])
+        frame['day'] = frame['snapshot_at'].dt.floor('D')
+        return frame.sort_values('snapshot_at').pivot_table(index='day', columns='user_id', values=metric,
+                                                            aggfunc='last')
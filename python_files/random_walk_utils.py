@@ -0,0 +1,184 @@
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from graph_store_utils import CSRGraph
+
+EDGE_OPERATORS = {
+  'hadamard': lambda a, b: a * b,
+  'average': lambda a, b: (a + b) / 2,
+  'l1': lambda a, b: np.abs(a - b),
+  'l2': lambda a, b: (a - b) ** 2,
+}
+_worker_walks = None  # (indptr, indices, sorted edge keys) set up once per process
+
+def _init_walk_worker(indptr, indices):
+  global _worker_walks
+  n = len(indptr) - 1
+  keys = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr)) * n + indices
+  if len(keys) > 1 and (keys[1:] < keys[:-1]).any():
+    keys = np.sort(keys)
+  _worker_walks = (indptr, indices, keys)
+
+def _has_edge(keys, n, u, v):
+  """ whether every u[i] -> v[i] is an edge, by binary search over the sorted edge keys """
+  wanted = u.astype(np.int64) * n + v
+  order = np.argsort(wanted)  # sorted queries make the binary searches much more cache friendly
+  pos = np.empty(len(wanted), dtype=np.int64)
+  pos[order] = np.minimum(np.searchsorted(keys, wanted[order]), len(keys) - 1)
+  return keys[pos] == wanted
+
+def _walk_batch(starts, walk_length, p, q, seed):
+  """
+  runs a node2vec walk of walk_length nodes from every start node, all the walkers stepping together;
+  returns a (len(starts), walk_length) int32 array padded with -1 after dead ends
+  """
+  indptr, indices, keys = _worker_walks
+  n = len(indptr) - 1
+  deg = np.diff(indptr)
+  rng = np.random.default_rng(seed)
+  walks = np.full((len(starts), walk_length), -1, dtype=np.int32)
+  walks[:, 0] = starts
+  active = np.arange(len(starts))
+  # unnormalized probability of moving back to the previous node, to one of its neighbours, or further away
+  back, stay, away = 1 / p, 1.0, 1 / q
+  top = max(back, stay, away)
+  for step in range(1, walk_length):
+    active = active[deg[walks[active, step - 1]] > 0]
+    if not len(active):
+      break
+    cur = walks[active, step - 1]
+    if step == 1 or back == stay == away:
+      walks[active, step] = indices[indptr[cur] + (rng.random(len(active)) * deg[cur]).astype(np.int64)]
+      continue
+    # second order step by rejection: draw a uniform neighbour, accept it with probability weight / top
+    prev = walks[active, step - 2]
+    pending = np.arange(len(active))
+    while len(pending):
+      c, t = cur[pending], prev[pending]
+      x = indices[indptr[c] + (rng.random(len(pending)) * deg[c]).astype(np.int64)]
+      weight = np.where(x == t, back, np.where(_has_edge(keys, n, t, x), stay, away))
+      accepted = rng.random(len(pending)) * top < weight
+      walks[active[pending[accepted]], step] = x[accepted]
+      pending = pending[~accepted]
+  return walks
+
+
+class RandomWalks:
+  """
+    node2vec random walks computed on the CSR arrays of a graph, batched over numpy arrays
+    instead of walking networkx dicts one node at a time.
+
+    Every round starts one walk from each node, in a shuffled order. The second order bias
+    (return parameter p, in-out parameter q) is applied by rejection sampling: a uniform neighbour
+    is drawn and accepted with probability proportional to its weight, which needs no per-edge
+    transition tables, so memory stays proportional to the number of edges. Batches of start nodes
+    are spread over n_jobs processes, each batch with its own seed, so the walks don't depend on n_jobs.
+
+    The object is a re-iterable corpus of walks as lists of str node names, which is what gensim's
+    Word2Vec expects, so the walks can be streamed to it epoch after epoch instead of kept in memory.
+
+  :param G: a networkx graph or a CSRGraph;
+  :param int walk_length: number of nodes in every walk;
+  :param int num_walks: number of walks started from every node;
+  :param float p: return parameter, high values make going back to the previous node less likely;
+  :param float q: in-out parameter, high values keep the walk close to its start (BFS-like);
+  :param int n_jobs: number of worker processes;
+  :param int batch_size: number of walks computed by each task;
+  :param int seed: seed of the walks.
+  """
+  def __init__(self, G, walk_length=30, num_walks=200, p=1.0, q=1.0, n_jobs=1, batch_size=10_000, seed=None):
+    self.graph = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
+    self.walk_length = walk_length
+    self.num_walks = num_walks
+    self.p = p
+    self.q = q
+    self.n_jobs = n_jobs
+    self.batch_size = batch_size
+    self.seed = np.random.SeedSequence(seed).entropy
+    self.tokens = np.array([str(name) for name in self.graph.names], dtype=object)
+
+  def __len__(self):
+    return self.num_walks * self.graph.n_nodes
+
+  def _tasks(self):
+    """ yields the (start nodes, seed) of every batch, round after round """
+    n = self.graph.n_nodes
+    seeds = np.random.SeedSequence(self.seed)
+    order = np.random.default_rng(seeds.spawn(1)[0])
+    for _ in range(self.num_walks):
+      starts = order.permutation(n).astype(np.int32)
+      for i in range(0, n, self.batch_size):
+        yield starts[i:i + self.batch_size], seeds.spawn(1)[0]
+
+  def batches(self):
+    """ yields the walks as int32 arrays of internal node IDs, one array per batch, padded with -1 """
+    args = (self.walk_length, self.p, self.q)
+    if self.n_jobs == 1:
+      _init_walk_worker(self.graph.indptr, self.graph.indices)
+      for starts, seed in self._tasks():
+        yield _walk_batch(starts, *args, seed)
+      return
+    with ProcessPoolExecutor(self.n_jobs, initializer=_init_walk_worker,
+                             initargs=(self.graph.indptr, self.graph.indices)) as executor:
+      pending = deque()  # at most two batches per process in flight, so memory stays bounded
+      for starts, seed in self._tasks():
+        pending.append(executor.submit(_walk_batch, starts, *args, seed))
+        if len(pending) >= 2 * self.n_jobs:
+          yield pending.popleft().result()
+      while pending:
+        yield pending.popleft().result()
+
+  def __iter__(self):
+    for walks in self.batches():
+      for walk in walks:
+        yield self.tokens[walk[walk >= 0]].tolist()
+
+  def save(self, path):
+    """ writes the walks to a text file, one space separated walk per line (gensim's corpus_file format) """
+    with open(path, 'w') as f:
+      for walk in self:
+        f.write(' '.join(walk) + '\n')
+
+
+def fit_node2vec(G, dimensions=64, walk_length=30, num_walks=200, p=1.0, q=1.0, n_jobs=1, seed=None,
+                 corpus_file=None, **skip_gram_params):
+  """
+  trains a node2vec embedding with gensim's skip-gram on RandomWalks of G, a drop-in replacement of
+  Node2Vec(G, dimensions, walk_length, num_walks, p=p, q=q, workers=n_jobs).fit(**skip_gram_params);
+  the walks are streamed to the trainer, or written once to corpus_file and read from there if given,
+  which lets gensim train on every core. Node embeddings are in model.wv, keyed by str(node).
+
+  :returns: a trained gensim Word2Vec model.
+  """
+  from gensim.models import Word2Vec
+  walks = RandomWalks(G, walk_length, num_walks, p, q, n_jobs=n_jobs, seed=seed)
+  params = {'window': 10, 'min_count': 1, 'batch_words': 4, 'sg': 1, 'workers': n_jobs,
+            'vector_size': dimensions, **skip_gram_params}
+  if seed is not None:
+    params.setdefault('seed', seed)
+  if corpus_file is not None:
+    walks.save(corpus_file)
+    return Word2Vec(corpus_file=corpus_file, **params)
+  return Word2Vec(walks, **params)
+
+def edge_embeddings(vectors, pairs, operator='hadamard'):
+  """
+  builds the embedding of every (u, v) pair from the embeddings of u and v at once, with the
+  'hadamard' (u * v), 'average', 'l1' (|u - v|) or 'l2' ((u - v)^2) operator.
+
+  :param vectors: gensim KeyedVectors (e.g. model.wv, keyed by str(node)) or a dict node -> vector;
+  :param pairs: a sequence or (k, 2) array of node pairs;
+  :param str operator: one of EDGE_OPERATORS;
+  :returns: a (k, dimensions) numpy array.
+  """
+  if operator not in EDGE_OPERATORS:
+    raise ValueError(f"Unknown operator: operator should be one of {tuple(EDGE_OPERATORS)}")
+  pairs = list(pairs)
+  nodes = [node for pair in pairs for node in pair]
+  if hasattr(vectors, 'key_to_index'):
+    rows = np.array([vectors.key_to_index[str(node)] for node in nodes], dtype=np.int64)
+    emb = vectors.vectors[rows]
+  else:
+    emb = np.array([vectors[node] for node in nodes])
+  emb = emb.reshape(len(pairs), 2, emb.shape[-1])
+  return EDGE_OPERATORS[operator](emb[:, 0], emb[:, 1])
@@ -0,0 +1,153 @@
+import time
+import pickle
+import sqlite3
+import threading
+from collections import Counter
+from credential_pool_utils import EndpointProxy
+
+HOUR = 60 * 60
+# how long (in seconds) a cached response stays valid for each endpoint
+DEFAULT_TTLS = {
+    'get_user': 6 * HOUR,
+    'lookup_users': 6 * HOUR,
+    'get_friend_ids': 24 * HOUR,
+    'get_follower_ids': 24 * HOUR,
+    'get_friends': 24 * HOUR,
+    'get_followers': 24 * HOUR,
+}
+
+
+class ResponseCache:
+    """
+        Disk-backed cache for Twitter API responses, stored in a SQLite file so that it
+        survives across notebook sessions and is shared by repeated or overlapping crawls.
+
+        Responses are keyed by endpoint, user (user_id or screen_name) and cursor, expire after
+        a per-endpoint TTL and, once the cache holds more than max_entries responses,
+        the least recently used ones are evicted. Hits, misses and expirations are counted per endpoint.
+
+    :param str path: path of the SQLite file (':memory:' keeps the cache in RAM);
+    :param dict ttls: seconds each endpoint's responses stay valid, defaults to DEFAULT_TTLS;
+        endpoints missing from the dictionary are never cached;
+    :param int max_entries: maximum number of responses kept before LRU eviction kicks in;
+    :param callable clock: returns the current time in seconds.
+    """
+    def __init__(self, path='twitter_cache.sqlite', ttls=None, max_entries=100_000, clock=time.time):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = Counter()
+        self.misses = Counter()
+        self.expired = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                endpoint TEXT, user TEXT, cursor INTEGER, payload BLOB,
+                                created REAL, accessed REAL,
+                                PRIMARY KEY (endpoint, user, cursor))""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __len__(self):
+        return self._size
+
+    def get(self, endpoint, user, cursor=-1):
+        """ returns (True, response) if a fresh response is cached, (False, None) otherwise """
+        now = self.clock()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created FROM responses WHERE endpoint=? AND user=? AND cursor=?",
+                                     (endpoint, user, cursor)).fetchone()
+            if row is None:
+                self.misses[endpoint] += 1
+                return False, None
+            payload, created = row
+            if now - created > self.ttls.get(endpoint, 0):
+                self._conn.execute("DELETE FROM responses WHERE endpoint=? AND user=? AND cursor=?",
+                                   (endpoint, user, cursor))
+                self._conn.commit()
+                self._size -= 1
+                self.expired[endpoint] += 1
+                self.misses[endpoint] += 1
+                return False, None
+            self._conn.execute("UPDATE responses SET accessed=? WHERE endpoint=? AND user=? AND cursor=?",
+                               (now, endpoint, user, cursor))
+            self._conn.commit()
+            self.hits[endpoint] += 1
+        return True, pickle.loads(payload)
+
+    def put(self, endpoint, user, cursor, response):
+        """ stores a response, evicting the least recently used ones if the cache is full """
+        now = self.clock()
+        payload = pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE endpoint=? AND user=? AND cursor=?",
+                                        (endpoint, user, cursor)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                               (endpoint, user, cursor, payload, now, now))
+            if exists is None:
+                self._size += 1
+            if self._size > self.max_entries:
+                self._conn.execute("""DELETE FROM responses WHERE rowid IN (
+                                        SELECT rowid FROM responses ORDER BY accessed LIMIT ?)""",
+                                   (self._size - self.max_entries,))
+                self._size = self.max_entries
+            self._conn.commit()
+
+    def clear(self):
+        """ removes every cached response and resets the counters """
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._size = 0
+        self.hits.clear()
+        self.misses.clear()
+        self.expired.clear()
+
+    def stats(self):
+        """ returns hits, misses and expirations for each endpoint as a dictionary """
+        endpoints = set(self.hits) | set(self.misses)
+        return {e: {'hits': self.hits[e], 'misses': self.misses[e], 'expired': self.expired[e]}
+                for e in sorted(endpoints)}
+
+
+def _request_key(kwargs):
+    """
+    builds the (user, cursor) part of the cache key from the keyword arguments of a call;
+    the user is keyed with the parameter naming it, user 12 and screen name '12' are different accounts
+    """
+    kwargs = dict(kwargs)
+    cursor = kwargs.pop('cursor', -1)
+    param = 'user_id' if kwargs.get('user_id') is not None else 'screen_name'
+    user = kwargs.pop(param, None)
+    if isinstance(user, (list, tuple)):
+        user = ','.join(str(u) for u in user)
+    key = f'{param}={user}'
+    if kwargs:  # other parameters (e.g. count) change the response, so they are part of the key
+        key += '|' + '&'.join(f'{k}={kwargs[k]}' for k in sorted(kwargs))
+    return key, cursor
+
+
+class CachedAPI(EndpointProxy):
+    """
+        Puts a ResponseCache in front of an API instance (or a CredentialPool): calls to the
+        endpoints with a TTL are answered from the cache when possible and stored in it otherwise,
+        every other attribute is passed through to the wrapped API.
+
+    :param api: a Twitter API instance or a CredentialPool;
+    :param ResponseCache cache: the cache answering the calls.
+    """
+    def __init__(self, api, cache):
+        self.api = api
+        self.cache = cache
+
+    def _wraps(self, endpoint):
+        return endpoint in self.cache.ttls
+
+    def _call_endpoint(self, endpoint, method, **kwargs):
+        user, cursor = _request_key(kwargs)
+        found, response = self.cache.get(endpoint, user, cursor)
+        if not found:
+            response = method(**kwargs)
+            self.cache.put(endpoint, user, cursor, response)
+        return response
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules live next to each other in python_files and import one another by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
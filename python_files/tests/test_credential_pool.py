@@ -0,0 +1,67 @@
+import tweepy
+from credential_pool_utils import CredentialPool, WINDOW
+from fake_twitter_api import FakeTwitterAPI, FakeTwitterGraph, VirtualClock, fake_credentials
+
+GRAPH = FakeTwitterGraph(200, 10, seed=0)
+
+
+def _crawl_time(n_credentials, n_users=60):
+    """ simulated seconds taken by one get_friend_ids call per user with n credentials """
+    clock = VirtualClock()
+    apis = fake_credentials(n_credentials, GRAPH, clock, wait_on_rate_limit=False, latency=0.2)
+    pool = CredentialPool(apis, clock=clock.now, sleep=clock.sleep)
+    for user_id in range(n_users):
+        pool.get_friend_ids(user_id=user_id, cursor=-1)
+    assert sum(api.calls['get_friend_ids'] for api in apis) == n_users
+    return clock.now()
+
+
+def test_throughput_scales_with_credentials():
+    # 60 calls to a 15-per-window endpoint: three extra windows with one token, none with four
+    single, pooled = _crawl_time(1), _crawl_time(4)
+    assert single >= 3 * WINDOW
+    assert pooled < WINDOW / 10
+    assert single / pooled > 4
+
+
+def test_calls_are_spread_over_the_credentials():
+    clock = VirtualClock()
+    apis = fake_credentials(3, GRAPH, clock, wait_on_rate_limit=False)
+    pool = CredentialPool(apis, clock=clock.now, sleep=clock.sleep)
+    for user_id in range(45):
+        pool.get_friend_ids(user_id=user_id, cursor=-1)
+    assert [api.calls['get_friend_ids'] for api in apis] == [15, 15, 15]
+
+
+def test_retries_after_unexpected_429():
+    # the token has fewer calls left than the pool believes, e.g. spent by another process
+    clock = VirtualClock()
+    api = FakeTwitterAPI(GRAPH, clock, wait_on_rate_limit=False, rate_limits={'get_friend_ids': 2})
+    waits = []
+    pool = CredentialPool([api], clock=clock.now, sleep=clock.sleep, on_wait=lambda e, s: waits.append((e, s)))
+    pages = [pool.get_friend_ids(user_id=user_id, cursor=-1)[0] for user_id in range(3)]
+    assert pages[2] == GRAPH.friend_ids(2).tolist()
+    assert api.calls['get_friend_ids'] == 3
+    assert waits and waits[0][0] == 'get_friend_ids'
+    assert clock.now() >= WINDOW
+
+
+def test_429_moves_on_to_another_credential():
+    clock = VirtualClock()
+    spent = FakeTwitterAPI(GRAPH, clock, wait_on_rate_limit=False, rate_limits={'get_friend_ids': 1})
+    spent.get_friend_ids(user_id=0, cursor=-1)
+    fresh = FakeTwitterAPI(GRAPH, clock, wait_on_rate_limit=False)
+    pool = CredentialPool([spent, fresh], clock=clock.now, sleep=clock.sleep)
+    for user_id in range(5):
+        pool.get_friend_ids(user_id=user_id, cursor=-1)
+    assert fresh.calls['get_friend_ids'] == 5
+    assert clock.now() < WINDOW
+
+
+def test_pool_pages_with_tweepy_cursor():
+    clock = VirtualClock()
+    pool = CredentialPool(fake_credentials(2, GRAPH, clock, wait_on_rate_limit=False),
+                          clock=clock.now, sleep=clock.sleep)
+    user_id = int(GRAPH.n_users - 1)
+    ids = [i for page in tweepy.Cursor(pool.get_follower_ids, user_id=user_id).pages() for i in page]
+    assert ids == GRAPH.follower_ids(user_id).tolist()
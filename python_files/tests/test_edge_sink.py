@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pytest
+from edge_sink_utils import EdgeSink
+
+
+def test_in_memory_sink_collects_edges_in_order():
+    sink = EdgeSink()
+    sink.add_targets(1, [2, 3])
+    sink.add_sources([4, 5], 1)
+    sink.add_edges(np.array([6]), np.array([7]))
+    frame = sink.to_frame()
+    assert frame.values.tolist() == [[1, 2], [1, 3], [4, 1], [5, 1], [6, 7]]
+    assert frame.dtypes.tolist() == [np.int64, np.int64]
+    assert len(sink) == 5
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'csv'])
+def test_sink_flushes_partitions_and_reopens_them(tmp_path, fmt):
+    path = str(tmp_path / 'edges')
+    sink = EdgeSink(path, fmt, chunk_size=3)
+    for target in range(10, 17):  # buffers are flushed once they hold chunk_size edges
+        sink.add_targets(1, [target])
+    assert len(sink.partitions) == 2 and len(sink) == 7  # two chunks of 3 flushed, one edge buffered
+    sink.flush()
+    assert sorted(os.listdir(path)) == [f'part-0000{i}.{fmt}' for i in range(3)]
+    reopened = EdgeSink(path, fmt)
+    assert len(reopened) == 7
+    assert reopened.to_frame().values.tolist() == [[1, t] for t in range(10, 17)]
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'csv'])
+def test_truncate_rolls_back_to_a_partition(tmp_path, fmt):
+    path = str(tmp_path / 'edges')
+    sink = EdgeSink(path, fmt, chunk_size=2)
+    for target in (2, 3, 4, 5, 6):
+        sink.add_targets(1, [target])
+    sink.flush()
+    sink.truncate(1)
+    assert len(sink) == 2 and len(os.listdir(path)) == 1
+    assert EdgeSink(path, fmt).to_frame().values.tolist() == [[1, 2], [1, 3]]
+
+
+def test_csv_round_trip_keeps_screen_names(tmp_path):
+    # names that pandas would read as missing values by default
+    names = ['NA', 'null', 'None', 'nan', 'N/A', '']
+    sink = EdgeSink(str(tmp_path / 'edges'), 'csv', chunk_size=4, dtype='object')
+    sink.add_sources(names, 'seed')
+    sink.flush()
+    frame = EdgeSink(str(tmp_path / 'edges'), 'csv', dtype='object').to_frame()
+    assert frame['source'].tolist() == names
+    assert frame['target'].tolist() == ['seed'] * len(names)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        EdgeSink(fmt='json')
@@ -0,0 +1,137 @@
+import os
+import networkx as nx
+import numpy as np
+import pytest
+import graph_features_utils
+from graph_features_utils import build_feature_index, load_ego_features, parse_featname_line
+
+N_FEATURES = 40
+
+
+def _write_ego(path, ego, nodes, columns, rng):
+    """ writes the .featnames, .feat and .egofeat files of an ego-network with random 0/1 features """
+    with open(path / f'{ego}.featnames', 'w') as f:
+        for i, column in enumerate(columns):
+            f.write(f'{i} education;school;id;anonymized feature {column}\n')
+    with open(path / f'{ego}.egofeat', 'w') as f:
+        f.write(' '.join(map(str, rng.integers(0, 2, len(columns)))) + '\n')
+    with open(path / f'{ego}.feat', 'w') as f:
+        for node in nodes:
+            f.write(' '.join(map(str, [node, *rng.integers(0, 2, len(columns))])) + '\n')
+
+
+def _parse_nodes(network, ego_nodes, path):
+    """ the original parse_nodes, one node and one feature at a time """
+    for node_id in ego_nodes:
+        featname_file = open(f'{path}/{node_id}.featnames', 'r')
+        feat_file = open(f'{path}/{node_id}.feat', 'r')
+        egofeat_file = open(f'{path}/{node_id}.egofeat', 'r')
+        ego_features = [int(x) for x in egofeat_file.readline().split(' ')]
+        network.nodes[node_id]['features'] = np.zeros(N_FEATURES)
+        i = 0
+        for line in featname_file:
+            key, val = parse_featname_line(line)
+            if ego_features[i] + 1 > network.nodes[node_id]['features'][key]:
+                network.nodes[node_id]['features'][key] = ego_features[i] + 1
+            i += 1
+        for line in feat_file:
+            featname_file.seek(0)
+            split = [int(x) for x in line.split(' ')]
+            node_id = split[0]
+            features = split[1:]
+            network.nodes[node_id]['features'] = np.zeros(N_FEATURES)
+            i = 0
+            for line in featname_file:
+                key, val = parse_featname_line(line)
+                if features[i] + 1 > network.nodes[node_id]['features'][key]:
+                    network.nodes[node_id]['features'][key] = features[i] + 1
+                i += 1
+        featname_file.close()
+        feat_file.close()
+        egofeat_file.close()
+
+
+def test_load_ego_features_matches_parse_nodes(tmp_path):
+    rng = np.random.default_rng(0)
+    # two ego-networks without common nodes, whose columns share some features (and repeat one)
+    _write_ego(tmp_path, 0, range(1, 30), [0, 3, 5, 5, 7, 12, 20], rng)
+    _write_ego(tmp_path, 100, range(101, 150), [3, 7, 8, 25, 39], rng)
+    network = nx.Graph()
+    network.add_nodes_from([0, 100, *range(1, 30), *range(101, 150)])
+    _parse_nodes(network, [0, 100], str(tmp_path))
+
+    matrix, node_index = load_ego_features([0, 100], n_features=N_FEATURES, path=str(tmp_path))
+    assert matrix.shape == (len(network), N_FEATURES)
+    assert set(node_index) == set(network)
+    for node, row in node_index.items():
+        np.testing.assert_array_equal(matrix[row].toarray().ravel(), network.nodes[node]['features'])
+
+
+def _read(path, ego):
+    """ the nodes, feature indices and values of an ego-network """
+    with open(path / f'{ego}.featnames') as f:
+        columns = [parse_featname_line(line)[0] for line in f]
+    with open(path / f'{ego}.egofeat') as f:
+        values = [[int(x) for x in f.read().split()]]
+    nodes = [ego]
+    with open(path / f'{ego}.feat') as f:
+        for line in f:
+            split = [int(x) for x in line.split()]
+            nodes.append(split[0])
+            values.append(split[1:])
+    return nodes, columns, values
+
+
+def test_nodes_of_several_ego_networks_keep_the_largest_values(tmp_path):
+    rng = np.random.default_rng(1)
+    _write_ego(tmp_path, 0, [1, 2], [0, 1], rng)
+    _write_ego(tmp_path, 1, [2], [1, 2], rng)  # the second ego and node 2 are also in the first one
+    matrix, node_index = load_ego_features([0, 1], path=str(tmp_path))
+    assert matrix.shape == (3, 3)
+    rows = {}
+    for ego in (0, 1):
+        nodes, columns, values = _read(tmp_path, ego)
+        for node, row in zip(nodes, values):
+            features = rows.setdefault(node, np.zeros(3))
+            for column, value in zip(columns, row):
+                features[column] = max(features[column], value + 1)
+    for node, features in rows.items():
+        np.testing.assert_array_equal(matrix[node_index[node]].toarray().ravel(), features)
+
+
+def test_feature_indices_beyond_n_features_are_rejected(tmp_path):
+    _write_ego(tmp_path, 0, [1], [0, 9], np.random.default_rng(2))
+    with pytest.raises(ValueError, match='at least 10'):
+        load_ego_features([0], n_features=9, path=str(tmp_path))
+
+
+def _rewrite(file, text, mtime_ns=None):
+    """ replaces the content of file, then sets its mtime if given """
+    file.write_text(text)
+    if mtime_ns is not None:
+        os.utime(file, ns=(mtime_ns, mtime_ns))
+
+
+def test_feature_index_is_rebuilt_when_a_source_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_features_utils, '_loaded_indices', {})
+    pattern, cache_file = str(tmp_path / '*.featnames'), str(tmp_path / 'index.npz')
+    source = tmp_path / '0.featnames'
+    _rewrite(source, '0 gender;anonymized feature 77\n')
+    mtime = source.stat().st_mtime_ns
+    _rewrite(tmp_path / '1.featnames', '0 locale;anonymized feature 3\n')
+    assert build_feature_index(pattern, cache_file, n_jobs=1).names == {3: 'locale', 77: 'gender'}
+
+    # same mtime and size: the cached index is used, even by a new process
+    _rewrite(source, '0 gender;anonymized feature 78\n', mtime)
+    graph_features_utils._loaded_indices.clear()
+    assert 78 not in build_feature_index(pattern, cache_file, n_jobs=1).names
+    # a new mtime invalidates it
+    _rewrite(source, '0 gender;anonymized feature 78\n', mtime + 10 ** 9)
+    assert build_feature_index(pattern, cache_file, n_jobs=1).names == {3: 'locale', 78: 'gender'}
+    # and so does a new size
+    mtime = source.stat().st_mtime_ns
+    _rewrite(source, '0 gender;anonymized feature 1078\n', mtime)
+    assert build_feature_index(pattern, cache_file, n_jobs=1).names == {3: 'locale', 1078: 'gender'}
+    # as well as a new source file
+    _rewrite(tmp_path / '2.featnames', '0 hometown;anonymized feature 5\n')
+    assert len(build_feature_index(pattern, cache_file, n_jobs=1)) == 3
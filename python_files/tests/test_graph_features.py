@@ -0,0 +1,165 @@
+import math
+import networkx as nx
+import numpy as np
+import pytest
+import community
+import graph_features_utils
+from graph_store_utils import CSRGraph
+from graph_features_utils import (CENTRALITY_MEASURES, LINK_FEATURES, CentralityCache, get_hc_features,
+                                  get_shortest_path, link_features, recommend_links, seed_overlap_matrix)
+
+
+def _pairs(G, n=200, seed=0):
+    """ a mix of linked and unlinked pairs """
+    rng = np.random.default_rng(seed)
+    nodes = list(G)
+    edges = list(G.edges())
+    linked = [edges[i] for i in rng.choice(len(edges), n // 2, replace=False)]
+    unlinked = [tuple(rng.choice(nodes, 2, replace=False).tolist()) for _ in range(n // 2)]
+    return linked + unlinked
+
+
+def _networkx_features(G, u, v):
+    """ the link features of a pair computed one at a time with networkx """
+    common = list(nx.common_neighbors(G, u, v))
+    union = len(set(G[u]) | set(G[v]))
+    return {'shortest_path': get_shortest_path(G, u, v),
+            'jaccard': len(common) / union if union else 0,
+            'common_neighbors': len(common),
+            'adamic_adar': sum(1 / math.log(G.degree(w)) for w in common if G.degree(w) > 1),
+            'preferential_attachment': G.degree(u) * G.degree(v)}
+
+
+@pytest.mark.parametrize('as_csr', [False, True])
+def test_link_features_match_networkx(as_csr):
+    G = nx.gnp_random_graph(150, 0.04, seed=3)
+    pairs = _pairs(G)
+    features = link_features(CSRGraph.from_networkx(G) if as_csr else G, pairs)
+    expected = np.array([[_networkx_features(G, u, v)[f] for f in LINK_FEATURES] for u, v in pairs])
+    np.testing.assert_allclose(features, expected)
+
+
+def test_link_features_shortest_path_on_directed_graphs():
+    G = nx.gnp_random_graph(120, 0.03, seed=4, directed=True)
+    pairs = _pairs(G)
+    features = link_features(G, pairs, features=('shortest_path',))
+    np.testing.assert_array_equal(features[:, 0], [get_shortest_path(G, u, v) for u, v in pairs])
+
+
+def test_link_features_do_not_depend_on_n_jobs():
+    G = nx.gnp_random_graph(150, 0.04, seed=3)
+    pairs = _pairs(G)
+    np.testing.assert_allclose(link_features(G, pairs, batch_size=30),
+                               link_features(G, pairs, n_jobs=2, batch_size=30))
+
+
+def test_link_features_reject_unknown_features():
+    with pytest.raises(ValueError):
+        link_features(nx.path_graph(3), [(0, 2)], features=('katz',))
+
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_centrality_measures_accept_csr_graphs(directed):
+    G = nx.gnp_random_graph(60, 0.08, seed=6, directed=directed)
+    graph = CSRGraph.from_networkx(G)
+    for measure, reference in (('degree', nx.degree_centrality), ('betweenness', nx.betweenness_centrality)):
+        params = {} if measure == 'degree' else {'n_jobs': 2}
+        values = CENTRALITY_MEASURES[measure](graph, **params)
+        expected = reference(G)
+        assert values.keys() == expected.keys()
+        np.testing.assert_allclose([values[n] for n in expected], list(expected.values()), atol=1e-12)
+    values, epsilon = CENTRALITY_MEASURES['approximate_betweenness'](graph, k=20, seed=1)
+    expected = nx.betweenness_centrality(G, k=20, seed=1)
+    assert values.keys() == expected.keys()
+    np.testing.assert_allclose([values[n] for n in expected], list(expected.values()), atol=1e-12)
+    assert epsilon > 0
+
+
+def test_centrality_cache_only_keeps_seeded_approximations(tmp_path):
+    G = nx.gnp_random_graph(60, 0.08, seed=6)
+    cache = CentralityCache(str(tmp_path))
+    exact = cache.compute(G, 'betweenness', n_jobs=1)
+    assert cache.compute(G, 'betweenness', n_jobs=2) == exact
+    assert len(list(tmp_path.iterdir())) == 1
+    seeded = cache.compute(G, 'approximate_betweenness', k=10, seed=3)
+    assert cache.compute(G, 'approximate_betweenness', k=10, seed=3) == seeded
+    assert len(list(tmp_path.iterdir())) == 2
+    cache.compute(G, 'approximate_betweenness', k=10)
+    assert len(list(tmp_path.iterdir())) == 2  # an unseeded sample is not reused
+
+
+def _overlaps(G, u, v):
+    """ common neighbours, jaccard and cosine overlap of a pair computed with networkx """
+    common = len(list(nx.common_neighbors(G, u, v)))
+    union = len(set(G[u]) | set(G[v]))
+    norm = math.sqrt(G.degree(u) * G.degree(v))
+    return common, common / union if union else 0, common / norm if norm else 0
+
+
+@pytest.mark.parametrize('as_csr', [False, True])
+def test_seed_overlap_matrix_matches_networkx(as_csr):
+    G = nx.gnp_random_graph(100, 0.08, seed=7)
+    G.add_node(100)  # a seed without neighbours
+    seeds = [0, 5, 17, 42, 99, 100, 63]
+    overlaps = seed_overlap_matrix(CSRGraph.from_networkx(G) if as_csr else G, seeds)
+    for u in seeds:
+        for v in seeds:
+            if u != v:
+                expected = _overlaps(G, u, v)
+                actual = [overlaps[name].loc[u, v] for name in ('common_neighbors', 'jaccard', 'cosine')]
+                np.testing.assert_allclose(actual, expected)
+
+    chunks = list(seed_overlap_matrix(G, seeds, chunk_size=3))
+    assert len(chunks) == 3
+    pairs = {}
+    for chunk in chunks:
+        for u, v, common, jaccard, cosine in chunk.itertuples(index=False):
+            pairs[frozenset((u, v))] = (common, jaccard, cosine)
+    assert sum(len(chunk) for chunk in chunks) == len(pairs)  # every pair once
+    for i, u in enumerate(seeds):
+        for v in seeds[i + 1:]:
+            expected = _overlaps(G, u, v)
+            if expected[0] == 0:
+                assert frozenset((u, v)) not in pairs
+            else:
+                np.testing.assert_allclose(pairs[frozenset((u, v))], expected)
+
+
+def test_recommend_links_ranks_with_the_link_features():
+    G = nx.gnp_random_graph(80, 0.06, seed=5)
+    for node, recommended in recommend_links(G, k=5, score='jaccard'):
+        assert isinstance(node, int)
+        assert all(not G.has_edge(node, v) and v != node for v, _ in recommended)
+        scores = [score for _, score in recommended]
+        assert scores == sorted(scores, reverse=True)
+        if recommended:
+            expected = link_features(G, [(node, v) for v, _ in recommended], features=('jaccard',))[:, 0]
+            np.testing.assert_allclose(scores, expected)
+
+
+def test_hc_features_only_run_louvain_for_community_features(monkeypatch):
+    monkeypatch.setattr(graph_features_utils, '_precomputed', {})
+    partitions = []
+    best_partition = community.best_partition
+
+    def counted_partition(G):
+        partitions.append(G)
+        return best_partition(G, random_state=0)
+
+    monkeypatch.setattr(community, 'best_partition', counted_partition)
+    G = nx.gnp_random_graph(60, 0.08, seed=9)
+    pairs = _pairs(G, n=20)
+    features = get_hc_features(G, pairs, None)
+    centrality = nx.degree_centrality(G)
+    expected = [[get_shortest_path(G, u, v), _networkx_features(G, u, v)['jaccard'], centrality[u], centrality[v]]
+                for u, v in pairs]
+    np.testing.assert_allclose(features, expected)
+    assert not partitions
+
+    same, size = get_hc_features(G, pairs, None, features=('same_community', 'u_community_size')).T
+    assert len(partitions) == 1
+    get_hc_features(G, pairs, None, features=('v_community_size',))
+    assert len(partitions) == 1  # made once per version of the graph
+    parts = best_partition(G, random_state=0)
+    np.testing.assert_array_equal(same, [parts[u] == parts[v] for u, v in pairs])
+    np.testing.assert_array_equal(size, [list(parts.values()).count(parts[u]) for u, _ in pairs])
@@ -0,0 +1,191 @@
+import numpy as np
+import pytest
+from edge_sink_utils import EdgeSink
+from crawl_metrics_utils import CrawlMetrics, MemorySink
+from fetch_budget_utils import FetchBudget
+from fake_twitter_api import FakeTwitterAPI, FakeTwitterGraph, VirtualClock, fake_credentials
+from graph_scraping_utils import (fetch_contacts, fetch_contacts_delta, fetch_network, iter_contacts, iter_network,
+                                  stream_to)
+
+GRAPH = FakeTwitterGraph(2000, 30, seed=1)
+
+
+def _metrics(clock, *sinks):
+    return CrawlMetrics(sinks=list(sinks), clock=clock.now)
+
+
+def _edges(frame):
+    return set(zip(frame['source'].tolist(), frame['target'].tolist()))
+
+
+def _streamed(batches):
+    return {(s, t) for sources, targets in batches for s, t in zip(sources.tolist(), targets.tolist())}
+
+
+def _failures(sink):
+    """ the (user, stage, error) of the users skipped because of an error """
+    return {(e['user'], e['stage'], e['error']) for e in sink.events if e['event'] == 'error' and 'stage' in e}
+
+
+def _cuts(frame):
+    report = frame.attrs['sampling']
+    return set(zip(report['user'], report['direction'], report['kept'], report['method']))
+
+
+def test_fetch_network_resumes_after_running_out_of_calls(tmp_path):
+    clock = VirtualClock()
+    reference = fetch_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=40, metrics=_metrics(clock),
+                              budget=FetchBudget(sample_size=40))
+
+    checkpoint_dir = str(tmp_path / 'crawl')
+    budget = FetchBudget(max_calls=25, sample_size=40)
+    partial = fetch_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=40, metrics=_metrics(clock),
+                            budget=budget, checkpoint_dir=checkpoint_dir)
+    assert budget.exhausted
+    assert 0 < len(partial) < len(reference)
+    assert 0 < len(_cuts(partial)) < len(_cuts(reference))
+    resumed = fetch_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=40, metrics=_metrics(clock),
+                            budget=FetchBudget(sample_size=40), checkpoint_dir=checkpoint_dir)
+    assert _edges(resumed) == _edges(reference)
+    assert len(resumed) == len(reference)
+    # the accounts sampled before the checkpoint are still reported, once
+    assert _cuts(resumed) == _cuts(reference)
+    assert len(resumed.attrs['sampling']) == len(reference.attrs['sampling'])
+
+
+def test_resuming_with_another_seed_or_priority_is_refused(tmp_path):
+    clock = VirtualClock()
+    checkpoint_dir = str(tmp_path / 'crawl')
+    fetch_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=10, metrics=_metrics(clock),
+                  budget=FetchBudget(max_calls=10), checkpoint_dir=checkpoint_dir)
+    with pytest.raises(ValueError, match='user 5'):
+        fetch_network(FakeTwitterAPI(GRAPH, clock), 6, max_users=10, metrics=_metrics(clock),
+                      checkpoint_dir=checkpoint_dir)
+    with pytest.raises(ValueError, match="priority 'proximity'"):
+        fetch_network(FakeTwitterAPI(GRAPH, clock), 5, priority='degree', max_users=10, metrics=_metrics(clock),
+                      checkpoint_dir=checkpoint_dir)
+
+
+def test_contacts_delta_of_a_cut_list_reports_no_removals(tmp_path):
+    clock = VirtualClock()
+    graph = FakeTwitterGraph(12000, 20, seed=1)
+    user = int(np.diff(graph.followers_indptr).argmax())
+    assert graph.followers_indptr[user + 1] - graph.followers_indptr[user] > 5000  # more than one page
+    snapshot_dir = str(tmp_path / 'snapshots')
+    first = fetch_contacts_delta(FakeTwitterAPI(graph, clock), [user], 'followers', snapshot_dir,
+                                 metrics=_metrics(clock), budget=FetchBudget(max_pages=1))
+    assert len(first) == 5000 and (first['change'] == 'added').all()
+    assert first.attrs['sampling']['user'].tolist() == [user]
+    # the most recent follower leaves and an older one slides into the window: neither shows up
+    start = graph.followers_indptr[user]
+    graph.followers = np.delete(graph.followers, start)
+    graph.followers_indptr[user + 1:] -= 1
+    second = fetch_contacts_delta(FakeTwitterAPI(graph, clock), [user], 'followers', snapshot_dir,
+                                  metrics=_metrics(clock), budget=FetchBudget(max_pages=1))
+    assert len(second) == 0
+    # a new follower in front of the window is reported
+    graph.followers = np.insert(graph.followers, start, 11999)
+    graph.followers_indptr[user + 1:] += 1
+    third = fetch_contacts_delta(FakeTwitterAPI(graph, clock), [user], 'followers', snapshot_dir,
+                                 metrics=_metrics(clock), budget=FetchBudget(max_pages=1))
+    assert third.values.tolist() == [[11999, user, 'added']]
+
+
+def test_contacts_delta_records_every_page_kept(tmp_path):
+    clock = VirtualClock()
+    graph = FakeTwitterGraph(25000, 20, seed=1)
+    user = int(np.diff(graph.followers_indptr).argmax())
+    count = graph.followers_indptr[user + 1] - graph.followers_indptr[user]
+    assert count > 10000  # more than two pages
+    frame = fetch_contacts_delta(FakeTwitterAPI(graph, clock), [user], 'followers', str(tmp_path / 'snapshots'),
+                                 metrics=_metrics(clock), budget=FetchBudget(max_pages=2))
+    assert len(frame) == 10000
+    assert frame.attrs['sampling'][['user', 'count', 'kept', 'method']].values.tolist() == \
+        [[user, count, 10000, 'first_pages']]
+
+
+def test_rate_limit_waits_of_a_single_credential_are_recorded():
+    clock = VirtualClock()
+    metrics = _metrics(clock)
+    fetch_contacts(FakeTwitterAPI(GRAPH, clock), list(range(20)), 'friends', metrics=metrics)
+    summary = metrics.summary()
+    assert summary['endpoints']['get_friend_ids']['calls'] == 20
+    assert summary['rate_limited_seconds'] > 0
+    assert summary['endpoints']['get_friend_ids']['mean_latency'] < 1
+
+
+def test_fetch_contacts_matches_the_graph():
+    clock = VirtualClock()
+    frame = fetch_contacts(fake_credentials(2, GRAPH, clock, wait_on_rate_limit=False), [3, 4], 'all',
+                           metrics=_metrics(clock))
+    expected = {(u, f) for u in (3, 4) for f in GRAPH.friend_ids(u).tolist()}
+    expected |= {(f, u) for u in (3, 4) for f in GRAPH.follower_ids(u).tolist()}
+    assert _edges(frame) == expected
+    assert len(frame) == len(expected)
+    streamed = iter_contacts(fake_credentials(2, GRAPH, clock, wait_on_rate_limit=False), [3, 4], 'all',
+                             metrics=_metrics(clock))
+    assert _streamed(streamed) == expected
+
+
+def test_iter_network_streams_the_edges_of_fetch_network():
+    clock = VirtualClock()
+    reference = fetch_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=20, metrics=_metrics(clock))
+    batches = iter_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=20, metrics=_metrics(clock))
+    assert _streamed(batches) == _edges(reference)
+    sink = stream_to(iter_network(FakeTwitterAPI(GRAPH, clock), 5, max_users=20, metrics=_metrics(clock)), EdgeSink())
+    assert sink.to_frame().equals(reference)
+
+
+def test_unknown_users_are_skipped_the_same_way_everywhere():
+    clock = VirtualClock()
+    known = fetch_contacts(FakeTwitterAPI(GRAPH, clock), [3], 'friends', metrics=_metrics(clock))
+    events = MemorySink()
+    frame = fetch_contacts(FakeTwitterAPI(GRAPH, clock), [99999, 3], 'friends', metrics=_metrics(clock, events))
+    assert _edges(frame) == _edges(known)
+    assert _failures(events) == {(99999, 'get_user', 'not_found')}
+    events = MemorySink()
+    batches = iter_contacts(FakeTwitterAPI(GRAPH, clock), [99999, 3], 'friends', metrics=_metrics(clock, events))
+    assert _streamed(batches) == _edges(known)
+    assert _failures(events) == {(99999, 'get_user', 'not_found')}
+
+
+def test_running_out_of_calls_is_not_a_failure():
+    clock = VirtualClock()
+    for crawl in (lambda api, **kw: fetch_network(api, 5, max_users=20, **kw),
+                  lambda api, **kw: iter_network(api, 5, max_users=20, **kw),
+                  lambda api, **kw: fetch_contacts(api, list(range(10)), 'all', **kw),
+                  lambda api, **kw: iter_contacts(api, list(range(10)), 'all', **kw)):
+        events, budget = MemorySink(), FetchBudget(max_calls=7)
+        result = crawl(FakeTwitterAPI(GRAPH, clock), metrics=_metrics(clock, events), budget=budget)
+        if not hasattr(result, 'attrs'):
+            list(result)
+        assert budget.exhausted
+        assert _failures(events) == set()
+
+
+def test_users_cut_by_the_call_budget_are_reported():
+    clock = VirtualClock()
+    budget = FetchBudget(max_calls=5)  # get_user + friends + followers for the first user, then half the second
+    frame = fetch_contacts(FakeTwitterAPI(GRAPH, clock), [3, 4, 6], 'all', metrics=_metrics(clock), budget=budget)
+    report = frame.attrs['sampling']
+    cut = report[report['method'] == 'budget']
+    assert set(zip(cut['user'], cut['direction'])) == {(4, 'followers'), (6, 'friends'), (6, 'followers')}
+    assert (cut['kept'] == 0).all()
+    assert set(frame['target'][frame['source'] == 4]) == set(GRAPH.friend_ids(4).tolist())
+
+
+def test_large_accounts_are_sampled_uniformly_and_repeatably():
+    clock = VirtualClock()
+    graph = FakeTwitterGraph(12000, 20, seed=1)
+    user = int(np.diff(graph.followers_indptr).argmax())
+    count = int(graph.followers_indptr[user + 1] - graph.followers_indptr[user])
+    frames = [fetch_contacts(FakeTwitterAPI(graph, clock), [user], 'followers', metrics=_metrics(clock),
+                             budget=FetchBudget(max_pages=None, sample_size=1000, seed=3)) for _ in range(2)]
+    assert frames[0].equals(frames[1])
+    followers = frames[0]['source'].to_numpy()
+    assert len(followers) == len(set(followers)) == 1000
+    assert set(followers) <= set(graph.follower_ids(user).tolist())
+    # a uniform sample reaches past the first page of 5000 IDs
+    assert np.isin(followers, graph.follower_ids(user)[5000:]).sum() > 100
+    assert frames[0].attrs['sampling'][['user', 'count', 'kept', 'method']].values.tolist() == \
+        [[user, count, 1000, 'reservoir']]
@@ -0,0 +1,37 @@
+import networkx as nx
+import numpy as np
+import pytest
+from graph_store_utils import CSRGraph, CSRGraphBuilder
+
+
+def _graph(names, directed):
+    G = nx.DiGraph() if directed else nx.Graph()
+    G.add_nodes_from(names)
+    G.add_edges_from([(names[0], names[1]), (names[1], names[2]), (names[2], names[0]), (names[3], names[1])])
+    return G  # names[4] and names[5] are isolated
+
+
+@pytest.mark.parametrize('directed', [True, False])
+@pytest.mark.parametrize('names', [['alice', 'bob', 'zoë', '名前', 'NA', 'carl'], [42, 7, 1001, 3, 99, 0]])
+@pytest.mark.parametrize('mmap', [True, False])
+def test_save_load_round_trip(tmp_path, names, directed, mmap):
+    G = _graph(names, directed)
+    graph = CSRGraph.from_networkx(G)
+    assert graph.n_nodes == 6
+    graph.save(str(tmp_path / 'graph'))
+    loaded = CSRGraph.load(str(tmp_path / 'graph'), mmap=mmap)
+    assert loaded.names.tolist() == graph.names.tolist() == sorted(names)
+    assert np.array_equal(loaded.indptr, graph.indptr) and np.array_equal(loaded.indices, graph.indices)
+    assert loaded.directed == directed
+    assert loaded.degree()[loaded.node_ids([names[4], names[5]])].tolist() == [0, 0]
+    assert nx.utils.graphs_equal(loaded.to_networkx(), G)
+
+
+def test_builder_deduplicates_streamed_batches():
+    builder = CSRGraphBuilder(compact_every=3)
+    builder.add_edges(np.array([1, 2]), np.array([2, 3]))
+    builder.add_edges(np.array([1, 3]), np.array([2, 1]))
+    assert len(builder) == 3
+    graph = builder.build()
+    assert graph.names.tolist() == [1, 2, 3]
+    assert graph.to_edgelist().values.tolist() == [[1, 2], [2, 3], [3, 1]]
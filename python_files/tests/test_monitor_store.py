@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from monitor_store_utils import MONITOR_SCHEMA, MonitorStore, derived_metrics, typed_snapshot
+
+CREATED = pd.Timestamp('2020-01-01', tz='UTC')
+
+
+def _snapshot(now, followers, friends=(10, 0), statuses=(100, 50)):
+    """ a twitter_monitor frame of two accounts taken at now """
+    frame = pd.DataFrame({'user_id': [1, 2], 'screen_name': ['alice', 'bob'], 'description': ['', None],
+                          'statuses_count': statuses, 'friends_count': friends, 'followers_count': followers,
+                          'created_at': [CREATED, CREATED]})
+    return typed_snapshot(frame, now)
+
+
+def _store(tmp_path):
+    store = MonitorStore(str(tmp_path / 'store'))
+    for now, followers, statuses in (('2024-03-01 10:00', (100, 5), (100, 50)),
+                                     ('2024-03-02 09:30', (110, 5), (104, 50)),
+                                     ('2024-03-02 21:00', (130, 4), (110, 51)),
+                                     ('2024-03-05 10:00', (160, 8), (130, 60))):
+        now = pd.Timestamp(now, tz='UTC')
+        store.append(_snapshot(now, followers, statuses=statuses), now)
+    return store
+
+
+def test_snapshots_are_typed():
+    frame = _snapshot(pd.Timestamp('2020-01-11', tz='UTC'), (1, 2))
+    assert frame.dtypes.astype(str).to_dict() == MONITOR_SCHEMA
+    assert frame['account_age_days'].tolist() == [10, 10]
+    assert frame['average_tweets'].tolist() == [10.0, 5.0]
+
+
+def test_load_reads_the_snapshots_of_a_range(tmp_path):
+    store = _store(tmp_path)
+    assert [str(date) for date in store.dates()] == ['2024-03-01', '2024-03-02', '2024-03-05']
+    assert len(store.load()) == 8
+    # dates cover the whole day, timestamps are exact
+    assert store.load('2024-03-02', '2024-03-02')['snapshot_at'].nunique() == 2
+    assert store.load('2024-03-02 12:00', '2024-03-05')['snapshot_at'].nunique() == 2
+    assert store.load('2024-03-03', '2024-03-04').empty
+    frame = store.load(users=['bob'], columns=['followers_count'])
+    assert list(frame.columns) == ['snapshot_at', 'followers_count']
+    assert frame['followers_count'].tolist() == [5, 5, 4, 8]
+    assert store.load(users=[1])['screen_name'].unique().tolist() == ['alice']
+    assert store.load()[list(MONITOR_SCHEMA)].dtypes.astype(str).to_dict() == MONITOR_SCHEMA
+    assert store.latest()['followers_count'].tolist() == [160, 8]
+
+
+def test_growth_between_the_first_and_last_snapshot_of_the_window(tmp_path):
+    store = _store(tmp_path)
+    growth = store.growth(days=3.5, end='2024-03-05 10:00').set_index('user_id')
+    # the window starts on 2024-03-01 22:00, after the first snapshot
+    assert growth.loc[1, ['first', 'last', 'change']].tolist() == [110, 160, 50]
+    assert growth.loc[2, ['first', 'last', 'change']].tolist() == [5, 8, 3]
+    np.testing.assert_allclose(growth['relative_change'], [50 / 110, 3 / 5], rtol=1e-6)
+    span = (pd.Timestamp('2024-03-05 10:00') - pd.Timestamp('2024-03-02 09:30')).total_seconds() / 86400
+    np.testing.assert_allclose(growth['per_day'], [50 / span, 3 / span], rtol=1e-6)
+
+
+def test_derived_metrics_compare_each_snapshot_with_the_previous_one(tmp_path):
+    frame = derived_metrics(_store(tmp_path).load())
+    alice = frame[frame['user_id'] == 1]
+    assert alice['followers_change'].tolist()[1:] == [10, 20, 30]
+    assert alice['followers_change'].isna().tolist() == [True, False, False, False]
+    assert alice['statuses_change'].tolist()[1:] == [4, 6, 20]
+    hours = np.array([23.5, 11.5, 61])
+    np.testing.assert_allclose(alice['followers_per_day'].iloc[1:], [10, 20, 30] / (hours / 24), rtol=1e-6)
+    assert alice['follower_friend_ratio'].tolist() == [10.0, 11.0, 13.0, 16.0]
+    assert frame[frame['user_id'] == 2]['follower_friend_ratio'].isna().all()  # no friends
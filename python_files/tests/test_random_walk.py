@@ -0,0 +1,54 @@
+import networkx as nx
+import numpy as np
+import pytest
+from random_walk_utils import RandomWalks
+
+G = nx.gnp_random_graph(80, 0.1, seed=8)
+G.remove_nodes_from(list(nx.isolates(G)))  # every walk runs its full length
+G = nx.convert_node_labels_to_integers(G)  # internal IDs are the node names
+
+
+def _steps(walks):
+    """ the (previous, current, next) nodes of every second order step of the walks """
+    steps = [np.stack([walks[:, i - 2], walks[:, i - 1], walks[:, i]], axis=1) for i in range(2, walks.shape[1])]
+    steps = np.concatenate(steps)
+    return steps[steps[:, 2] >= 0]
+
+
+def test_walks_follow_edges_and_do_not_depend_on_n_jobs():
+    walks = RandomWalks(G, walk_length=12, num_walks=4, p=0.5, q=2.0, batch_size=15, seed=1)
+    assert len(walks) == 4 * len(G)
+    corpus = list(walks)
+    assert len(corpus) == len(walks) and all(len(walk) == 12 for walk in corpus)
+    assert all(G.has_edge(int(u), int(v)) for walk in corpus for u, v in zip(walk, walk[1:]))
+    # every round starts one walk from each node
+    assert sorted(int(walk[0]) for walk in corpus) == sorted(list(G) * 4)
+    parallel = RandomWalks(G, walk_length=12, num_walks=4, p=0.5, q=2.0, n_jobs=2, batch_size=15, seed=1)
+    assert list(parallel) == corpus
+    assert list(RandomWalks(G, walk_length=12, num_walks=4, p=0.5, q=2.0, batch_size=15, seed=2)) != corpus
+
+
+def test_walks_stop_at_dead_ends():
+    D = nx.DiGraph([(0, 1), (1, 2)])
+    walks = np.vstack(list(RandomWalks(D, walk_length=5, num_walks=1, seed=0).batches()))
+    assert sorted(walks.tolist()) == [[0, 1, 2, -1, -1], [1, 2, -1, -1, -1], [2, -1, -1, -1, -1]]
+
+
+@pytest.mark.parametrize('p, q', [(0.25, 1.0), (1.0, 0.25), (4.0, 4.0)])
+def test_second_order_steps_follow_the_node2vec_bias(p, q):
+    walks = np.vstack(list(RandomWalks(G, walk_length=20, num_walks=30, p=p, q=q, seed=3).batches()))
+    steps = _steps(walks)
+    back, away, expected_back, expected_away, variance = 0, 0, 0.0, 0.0, 0.0
+    for t, c, x in steps.tolist():
+        # unnormalized node2vec weights of the neighbours of c, coming from t
+        weights = {w: 1 / p if w == t else 1.0 if G.has_edge(t, w) else 1 / q for w in G[c]}
+        total = sum(weights.values())
+        p_back = weights[t] / total
+        p_away = sum(v for w, v in weights.items() if w != t and not G.has_edge(t, w)) / total
+        back += x == t
+        away += x != t and not G.has_edge(t, x)
+        expected_back += p_back
+        expected_away += p_away
+        variance += max(p_back * (1 - p_back), p_away * (1 - p_away))
+    assert abs(back - expected_back) < 5 * np.sqrt(variance)
+    assert abs(away - expected_away) < 5 * np.sqrt(variance)
@@ -0,0 +1,84 @@
+from response_cache_utils import ResponseCache, CachedAPI, _request_key
+from fake_twitter_api import FakeTwitterAPI, FakeTwitterGraph, VirtualClock
+
+GRAPH = FakeTwitterGraph(200, 10, seed=0)
+
+
+def _cache(clock, **kwargs):
+    return ResponseCache(':memory:', clock=clock.now, **kwargs)
+
+
+def test_repeated_calls_are_answered_from_the_cache():
+    clock = VirtualClock()
+    api = FakeTwitterAPI(GRAPH, clock)
+    cache = _cache(clock)
+    cached = CachedAPI(api, cache)
+    first = cached.get_friend_ids(user_id=3, cursor=-1)
+    second = cached.get_friend_ids(user_id=3, cursor=-1)
+    assert first == second
+    assert api.calls['get_friend_ids'] == 1
+    assert cache.stats()['get_friend_ids'] == {'hits': 1, 'misses': 1, 'expired': 0}
+    # other users, cursors and parameters are other entries
+    cached.get_friend_ids(user_id=4, cursor=-1)
+    cached.get_friend_ids(user_id=3, cursor=-1, count=10)
+    assert api.calls['get_friend_ids'] == 3
+
+
+def test_responses_expire_after_their_ttl():
+    clock = VirtualClock()
+    api = FakeTwitterAPI(GRAPH, clock, latency=0)
+    cache = _cache(clock, ttls={'get_user': 60})
+    cached = CachedAPI(api, cache)
+    cached.get_user(user_id=1)
+    clock.sleep(59)
+    cached.get_user(user_id=1)
+    assert api.calls['get_user'] == 1
+    clock.sleep(2)
+    cached.get_user(user_id=1)
+    assert api.calls['get_user'] == 2
+    assert cache.stats()['get_user']['expired'] == 1
+
+
+def test_user_ids_and_screen_names_are_different_keys():
+    # the account with ID 12 and the account named '12' are not the same account
+    assert _request_key({'user_id': 12}) != _request_key({'screen_name': '12'})
+    clock = VirtualClock()
+    api = FakeTwitterAPI(GRAPH, clock)
+    cached = CachedAPI(api, _cache(clock))
+    cached.get_friend_ids(user_id=12, cursor=-1)
+    cached.get_friend_ids(screen_name='12', cursor=-1)
+    assert api.calls['get_friend_ids'] == 2
+
+
+def test_endpoints_without_ttl_are_not_cached():
+    clock = VirtualClock()
+    api = FakeTwitterAPI(GRAPH, clock)
+    cached = CachedAPI(api, _cache(clock, ttls={'get_user': 60}))
+    cached.get_friend_ids(user_id=1, cursor=-1)
+    cached.get_friend_ids(user_id=1, cursor=-1)
+    assert api.calls['get_friend_ids'] == 2
+
+
+def test_least_recently_used_responses_are_evicted():
+    clock = VirtualClock()
+    cache = _cache(clock, max_entries=2)
+    cache.put('get_user', 'a', -1, 'A')
+    clock.sleep(1)
+    cache.put('get_user', 'b', -1, 'B')
+    clock.sleep(1)
+    assert cache.get('get_user', 'a') == (True, 'A')  # 'a' is now more recent than 'b'
+    clock.sleep(1)
+    cache.put('get_user', 'c', -1, 'C')
+    assert len(cache) == 2
+    assert cache.get('get_user', 'b') == (False, None)
+    assert cache.get('get_user', 'a') == (True, 'A')
+    assert cache.get('get_user', 'c') == (True, 'C')
+
+
+def test_cache_persists_on_disk(tmp_path):
+    clock = VirtualClock()
+    path = str(tmp_path / 'cache.sqlite')
+    ResponseCache(path, clock=clock.now).put('get_user', '1', -1, {'id': 1})
+    reopened = ResponseCache(path, clock=clock.now)
+    assert len(reopened) == 1
+    assert reopened.get('get_user', '1') == (True, {'id': 1})
@@ -0,0 +1,31 @@
+from fake_twitter_api import FakeTwitterAPI, FakeTwitterGraph, VirtualClock
+from user_hydration_utils import UserHydrator
+
+GRAPH = FakeTwitterGraph(500, 10, seed=2)
+
+
+def test_every_account_is_looked_up_once_in_batches():
+    api = FakeTwitterAPI(GRAPH, VirtualClock())
+    hydrator = UserHydrator(api)
+    ids = list(range(250)) + list(range(100))  # repeated IDs
+    profiles = hydrator.hydrate(ids)
+    assert [user.id for user in profiles] == ids
+    assert api.calls['lookup_users'] == 3  # 250 distinct IDs, 100 per call
+    assert hydrator.hydrate([5, 7, 249]) == [profiles[5], profiles[7], profiles[249]]
+    assert api.calls['lookup_users'] == 3  # already known, no call
+    # screen names resolve to the hydrated profiles, whatever their case
+    assert hydrator.lookup_names(['user5', 'USER7']) == [profiles[5], profiles[7]]
+    assert api.calls['lookup_users'] == 3
+
+
+def test_missing_accounts_resolve_to_none():
+    api = FakeTwitterAPI(GRAPH, VirtualClock())
+    hydrator = UserHydrator(api, batch_size=2)
+    # the second batch holds no existing account and is answered with a 404
+    profiles = hydrator.hydrate([1, 10_000, 10_001, 10_002, 3])
+    assert [None if user is None else user.id for user in profiles] == [1, None, None, None, 3]
+    assert api.calls['lookup_users'] == 3
+    assert hydrator.hydrate([10_001]) == [None]  # not asked again
+    assert api.calls['lookup_users'] == 3
+    assert hydrator.lookup_names(['nobody', 'user4']) == [None, hydrator.profiles[4]]
+    assert hydrator.screen_names([1, 10_000, 4]) == ['user1', 'user4']
@@ -0,0 +1,62 @@
+import tweepy
+from credential_pool_utils import map_users
+
+LOOKUP_BATCH = 100  # maximum number of users resolved by a single lookup_users call
+
+
+class UserHydrator:
+    """
+        Resolves user IDs and screen names to full profiles with api.lookup_users,
+        100 users per call, instead of one api.get_user call per account.
+
+        Every profile fetched is kept in a local ID -> profile map, so the same account is
+        hydrated only once no matter how many seeds (or calls of the scraping functions) it appears in.
+        Accounts that no longer exist (suspended, deleted) are resolved to None.
+
+    :param api: a Twitter API instance, a CredentialPool or a CachedAPI;
+    :param int batch_size: number of users requested per lookup_users call (at most 100).
+    """
+    def __init__(self, api, batch_size=LOOKUP_BATCH):
+        self.api = api
+        self.batch_size = min(batch_size, LOOKUP_BATCH)
+        self.profiles = {}  # user ID -> profile
+        self.ids = {}       # lowercased screen name -> user ID
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def _lookup(self, key, values):
+        """ fetches the profiles of the given IDs / screen names in batches, concurrently on a pool """
+        batches = [values[i:i + self.batch_size] for i in range(0, len(values), self.batch_size)]
+
+        def lookup(batch):
+            try:
+                return self.api.lookup_users(**{key: batch})
+            except tweepy.NotFound:
+                return []  # Twitter answers 404 when none of the batch exists
+        for users in map_users(self.api, lookup, batches):
+            for user in users:
+                self.profiles[user.id] = user
+                self.ids[user.screen_name.lower()] = user.id
+
+    def hydrate(self, user_ids):
+        """ returns the profiles of the given user IDs (None for missing accounts) """
+        missing = [i for i in dict.fromkeys(user_ids) if i not in self.profiles]
+        if missing:
+            self._lookup('user_id', missing)
+            for i in missing:
+                self.profiles.setdefault(i, None)  # not returned by Twitter, don't ask again
+        return [self.profiles.get(i) for i in user_ids]
+
+    def lookup_names(self, screen_names):
+        """ returns the profiles of the given screen names (None for missing accounts) """
+        missing = [name for name in dict.fromkeys(screen_names) if name.lower() not in self.ids]
+        if missing:
+            self._lookup('screen_name', missing)
+            for name in missing:
+                self.ids.setdefault(name.lower(), None)
+        return [self.profiles.get(self.ids.get(name.lower())) for name in screen_names]
+
+    def screen_names(self, user_ids):
+        """ returns the screen names of the given user IDs, skipping missing accounts """
+        return [user.screen_name for user in self.hydrate(user_ids) if user is not None]